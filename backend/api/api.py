@@ -1,7 +1,3 @@
-import numpy as np
-import math
-import os
-import pickle
 import sys
 
 from flask import abort, jsonify
@@ -11,46 +7,18 @@ from flask_restful import Api, Resource, request
 from flask_marshmallow import Marshmallow
 from flask_sqlalchemy_session import flask_scoped_session
 
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 sys.path.append('..')
 from backend.api.api_utils import *
-from backend.classes.item import Item
+from backend.api.model_loader import ModelLoader
+from backend.classes.metadata import Metadata
 from backend.classes.schemas import *
 from recommender_conf import *
 
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.preprocessing.text import Tokenizer
-
-
-# Make Keras reserve less GPU memory if using GPU
-gpus = tf.config.experimental.list_physical_devices('GPU')
-if gpus:
-  try:
-    for gpu in gpus:
-      tf.config.experimental.set_memory_growth(gpu, True)
-  except RuntimeError as e:
-    print(e)
-
-# DNN setup
-AUTHORS_TOKENIZER = pickle.load(open('models/author_tokenizer.pkl', 'rb'))
-PUBLISHERS_TOKENIZER = pickle.load(open('models/publishers_tokenizer.pkl', 'rb'))
-SERIESS_TOKENIZER = pickle.load(open('models/series_tokenizer.pkl', 'rb'))
-GENRES_TOKENIZER = pickle.load(open('models/genres_tokenizer.pkl', 'rb'))
-SUBJECTS_TOKENIZER = pickle.load(open('models/subjects_tokenizer.pkl', 'rb'))
-FIELD_LENGTHS = pickle.load(open('models/field_lengths.pkl', 'rb'))
-MODEL = keras.models.load_model('models/dnn')
-TOKENIZERS = {
-    'author': AUTHORS_TOKENIZER,
-    'publisher': PUBLISHERS_TOKENIZER,
-    'series': SERIESS_TOKENIZER,
-    'genres': GENRES_TOKENIZER,
-    'subjects': SUBJECTS_TOKENIZER
-}
-keras.backend.clear_session()
+# DNN model and its tokenizers are loaded in the background when they are first needed
+MODELS = ModelLoader()
 
 # App config
 app = Flask(__name__)
@@ -62,9 +30,21 @@ api = Api(app)
 
 # Database init
 engine = create_engine(f'sqlite:///data/recommender.db', echo=False)
+EntityStatistic.__table__.create(engine, checkfirst=True)
+Metadata.__table__.create(engine, checkfirst=True)
 session_factory = sessionmaker(bind=engine)
 session = flask_scoped_session(session_factory, app)
 
+# Recommendations fall back to heuristics without resource statistics until they are built
+with engine.connect() as connection:
+    if connection.execute(EntityStatistic.__table__.select().limit(1)).first() is None:
+        print('Entity statistics have not been built, run ml/build_statistics.py to build them')
+
+
+@app.errorhandler(400)
+def bad_request(e):
+    return jsonify(error=str(e)), 400
+
 
 @app.errorhandler(404)
 def not_found(e):
@@ -132,7 +112,7 @@ class ItemResource(Resource):
             abort(404, description='Item not found')
         else:
             item_from_schema = item_schema.dump(item)
-            item_from_schema['circulation_sequence'] = item.circulation_sequence
+            item_from_schema['circulation_sequence'] = item.circulation_sequence.tolist()
             item_from_schema['series'] = item_from_schema['series'][0] if len(
                 item_from_schema['series']) > 0 else None
 
@@ -200,11 +180,41 @@ class SubjectResource(Resource):
 class SelectionRecommendationResource(Resource):
     def get(self):
         args = request.args
-        res = get_recommendation(args, session, TOKENIZERS, MODEL, FIELD_LENGTHS)
+        tokenizers, model, field_lengths = MODELS.get()
+        res = get_recommendation(args, session, tokenizers, model, field_lengths)
+
+        return jsonify(res)
+
+
+class SelectionBatchRecommendationResource(Resource):
+    def post(self):
+        data = request.get_json(silent=True)
+        items = data['items'] if isinstance(data, dict) and 'items' in data else data
+
+        if not isinstance(items, list) or not all(isinstance(x, dict) for x in items):
+            abort(400, description='Request body must be a list of items')
+        if len(items) > MAX_BATCH_RECOMMENDATIONS:
+            abort(400, description=f'Batch can contain at most {MAX_BATCH_RECOMMENDATIONS} items')
+
+        args = [parse_recommendation_args(x) for x in items]
+        tokenizers, model, field_lengths = MODELS.get()
+        res = get_batch_recommendation(args, session, tokenizers, model, field_lengths)
 
         return jsonify(res)
 
 
+class ReadinessResource(Resource):
+    def get(self):
+        MODELS.start()
+        status = MODELS.status()
+        return status, 200 if status['ready'] else 503
+
+
+class StatisticsCacheResource(Resource):
+    def get(self):
+        return jsonify(STATISTICS_CACHE.info())
+
+
 # Basic resources
 api.add_resource(AuthorListResource, '/api/authors/')
 api.add_resource(AuthorResource, '/api/authors/<int:author_id>')
@@ -223,6 +233,13 @@ api.add_resource(SubjectResource, '/api/subjects/<int:subject_id>')
 # Recommendation resource
 api.add_resource(SelectionRecommendationResource,
                  '/api/recommendation/selection')
+api.add_resource(SelectionBatchRecommendationResource,
+                 '/api/recommendation/selection/batch')
+
+# Status resources
+api.add_resource(ReadinessResource, '/api/status/ready')
+api.add_resource(StatisticsCacheResource, '/api/status/cache')
 
 if __name__ == "__main__":
+    MODELS.start()
     app.run(debug=True, port=5000)
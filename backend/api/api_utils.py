@@ -11,11 +11,26 @@ from backend.classes.publisher import Publisher
 from backend.classes.item import Item
 from backend.classes.genre import Genre
 from backend.classes.db_item import DBItem
+from backend.classes.entity_statistic import EntityStatistic
 from backend.classes.biblio import Biblio
 from backend.classes.base import Base
 from backend.classes.author import Author
+from backend.api.circulation import open_circulation_matrix
+from backend.api.statistics_cache import StatisticsCache, save_statistics_version
 from backend.api.recommender_conf import *
-from backend.ml.ml_utils import pad_sequence
+from backend.ml.feature_encoder import encode_items
+
+# Statistics of resources shared by requests of this process
+STATISTICS_CACHE = StatisticsCache()
+
+# Heading attribute of each resource type that has statistics
+ENTITY_HEADINGS = {
+    'Author': 'name',
+    'Publisher': 'name',
+    'Series': 'label',
+    'Genre': 'label',
+    'Subject': 'label'
+}
 
 
 def was_usable_feature(entity, tokenizer):
@@ -23,8 +38,11 @@ def was_usable_feature(entity, tokenizer):
     Returns true if tokenizer finds the entity and false if not.
 
     :param entity: entity in string form
-    :param tokenizer: tokenizer used to transform entity into a feature vector form
+    :param tokenizer: tokenizer used to transform entity into a feature vector form, None if not loaded
     """
+    if tokenizer is None:
+        return False
+
     return entity.replace(' ', '_') in tokenizer.word_index
 
 
@@ -66,49 +84,62 @@ def get_newitem_score(heading, t):
     return ni_score
 
 
-def get_trend(data, months=13, normalized=False):
+def get_trend(circulation, lengths, months=13, normalized=False):
     """
     Calculates trend given the circulation data.
 
-    :param data: array consisting of circulation log data
+    :param circulation: circulation matrix of items with columns aligned to the months of circulation log
+    :param lengths: lengths of circulation sequences of items
     :param months: number of months to calculate the trend to
     :param normalized: boolean whether to normalize output based on item count
     """
-    trend = [0 for x in range(months)]
-    item_count = 0
+    trend = np.zeros(months, dtype=np.int64)
+    latest_months = min([months, circulation.shape[1]])
 
-    for sequence in data:
-        for datapoint in range(min([len(sequence), months])):
-            index = -datapoint - 1
-            trend[index] += sequence[index]
-            item_count += 1
+    if latest_months > 0:
+        trend[-latest_months:] = circulation[:, -latest_months:].sum(axis=0, dtype=np.int64)
+
+    item_count = int(np.minimum(lengths, months).sum())
 
     if normalized:
         if item_count > 0:
-            trend = [x / item_count for x in trend]
+            trend = trend / item_count
 
-    return trend[:12]
+    return trend[:12].tolist()
 
 
-def calculate_totals(data, months=0):
+def calculate_totals(headings, circulation, months=0):
     """
     Calculates total circulation given the data.
 
-    :param data: circulation data
+    :param headings: headings that rows of circulation belong to
+    :param circulation: circulation matrix with columns aligned to the months of circulation log
     :param months: how many latest months to include to calculations
     """
+    if months > 0:
+        circulation = circulation[:, -months:]
+
+    totals = circulation.sum(axis=1, dtype=np.int64).tolist()
     result = {}
-    for d in data:
-        if d[0] not in result:
-            if months <= 0:
-                result[d[0]] = sum(d[1])
-            else:
-                result[d[0]] = sum(d[1][-months:])
-        else:
-            if months <= 0:
-                result[d[0]] += sum(d[1])
-            else:
-                result[d[0]] += sum(d[1][-months:])
+
+    for heading, total in zip(headings, totals):
+        result[heading] = result.get(heading, 0) + total
+
+    result = list(result.items())
+    result.sort(key=lambda x: x[1], reverse=True)
+    return result
+
+
+def calculate_itemcounts(data):
+    """
+    Calculates item counts per heading. Counts of resources sharing the same
+    heading are summed together.
+
+    :param data: item count data as (heading, count) pairs
+    """
+    result = {}
+    for heading, count in data:
+        result[heading] = result.get(heading, 0) + count
 
     result = list(result.items())
     result.sort(key=lambda x: x[1], reverse=True)
@@ -122,18 +153,34 @@ def calculate_normalized_totals(items, circulation):
     :param items: item data
     :param circulation: circulation data
     """
-    items = dict(items)
+    # Resources sharing a heading are combined the same way as in calculate_totals
+    items = dict(calculate_itemcounts(items))
     circulation = dict(circulation)
     result = {}
 
     for key in items.keys():
-        result[key] = circulation[key] / items[key]
+        result[key] = circulation[key] / items[key] if items[key] > 0 else 0
 
     result = list(result.items())
     result.sort(key=lambda x: x[1], reverse=True)
     return result
 
 
+def build_rank_index(data):
+    """
+    Builds an index from heading to its rank and value in sorted data.
+
+    :param data: data as (heading, value) pairs sorted by rank
+    """
+    index = {}
+    for rank, (heading, value) in enumerate(data):
+        if heading in index:
+            raise ValueError(f'Heading {heading} is ranked more than once, combine duplicate headings before ranking')
+        index[heading] = (rank, value)
+
+    return index
+
+
 def rank_to_points(rank, total_items):
     """
     Calculates points from rank according to configurations.
@@ -227,6 +274,26 @@ def calculate_list_feature_score(feature_list, t):
     }
 
 
+def get_dnn_predictions(ml_pred_items, model, tokenizers, field_lengths):
+    """
+    Returns dnn predictions for multiple items with a single call to the model.
+    Single items are passed to the model directly as predict has a high overhead per call.
+
+    :param ml_pred_items: Item-class objects to make predictions from
+    :param model: DNN model to use for making predictions
+    :param tokenizers: array of tokenizers to be used to extract features from items
+    :param field_lengths: fields lengths for padding features
+    """
+    X = encode_items(ml_pred_items, tokenizers, field_lengths)
+
+    if len(ml_pred_items) == 1:
+        prediction = np.asarray(model(X, training=False))
+    else:
+        prediction = model.predict(X)
+
+    return np.argmax(prediction, axis=1)
+
+
 def get_dnn_prediction(ml_pred_item, model, tokenizers, field_lengths):
     """
     Returns dnn prediction given the array of tokenizers and dnn model.
@@ -235,43 +302,151 @@ def get_dnn_prediction(ml_pred_item, model, tokenizers, field_lengths):
     :param model: DNN model to use for making prediction
     :param tokenizers: array of tokenizers to be used to extract features from item
     """
-    X1, X2, X3, X4, X5 = [[] for x in range(5)]
-    author = tokenizers['author'].texts_to_sequences(
-        [ml_pred_item.get_feature('authors')])[0]
-    author = pad_sequence(author, field_lengths['authors'])
-    X1.append(author)
+    return get_dnn_predictions([ml_pred_item], model, tokenizers, field_lengths)[0]
+
+
+def calculate_entity_statistics(t, h, session, circulation):
+    """
+    Calculates statistics of every resource of given type with a single set of queries.
 
-    genres = tokenizers['genres'].texts_to_sequences(
-        [ml_pred_item.get_feature('genres')])[0]
-    genres = pad_sequence(genres, field_lengths['genres'])
-    X2.append(genres)
+    :param t: type of resources
+    :param h: label of heading in database
+    :param session: database session
+    :param circulation: CirculationMatrix-class object of all items
+    """
+    if t in ['Author', 'Publisher']:
+        resources_by_itemcount = session.query(eval(t).id, eval(f'{t}.{h}'), func.count(
+            DBItem.id)).outerjoin(DBItem).group_by(eval(t).id).order_by(func.count(DBItem.id).desc()).all()
+        resource_items = session.query(eval(f'{t}.{h}'), DBItem.id).outerjoin(DBItem).all()
+        current_items = session.query(eval(f'DBItem.{t.lower()}_id'), DBItem.id).filter(
+            eval(f'DBItem.{t.lower()}_id') != None, DBItem.deleted == None).all()
+    else:
+        resources_by_itemcount = session.query(eval(t).id, eval(f'{t}.{h}'), func.count(DBItem.id)).join(
+            DBItem, eval(t).items).group_by(eval(t).id).order_by(func.count(DBItem.id).desc()).all()
+        resource_items = session.query(eval(f'{t}.{h}'), DBItem.id).join(DBItem, eval(t).items).all()
+        current_items = session.query(eval(t).id, DBItem.id).join(
+            DBItem, eval(t).items).filter(DBItem.deleted == None).all()
+
+    # Resources without items are joined with empty circulation
+    resource_circulation, _ = circulation.rows([x[1] for x in resource_items])
+
+    # Resources sharing a heading are ranked as one, every one of them gets the combined statistics
+    resources_by_historical_itemcount = calculate_itemcounts([(x[1], x[2]) for x in resources_by_itemcount])
+    resources_by_historical_circulation = calculate_totals(
+        [x[0] for x in resource_items], resource_circulation)
+    resources_by_normalized_historical_circulation = calculate_normalized_totals(
+        resources_by_historical_itemcount, resources_by_historical_circulation)
+
+    itemcount_ranks = build_rank_index(resources_by_historical_itemcount)
+    circulation_ranks = build_rank_index(resources_by_historical_circulation)
+    normalized_circulation_ranks = build_rank_index(resources_by_normalized_historical_circulation)
+
+    items_by_resource = {}
+    for resource_id, item_id in current_items:
+        items_by_resource.setdefault(resource_id, []).append(item_id)
+
+    statistics = []
+    for resource_id, heading, _ in resources_by_itemcount:
+        resource_item_data, resource_lengths = circulation.rows(items_by_resource.get(resource_id, []))
+
+        statistics.append({
+            'entity_type': t,
+            'entity_id': resource_id,
+            'heading': heading,
+            'current_itemcount': len(resource_lengths),
+            'historical_itemcount': itemcount_ranks[heading][1],
+            'historical_itemcount_rank': itemcount_ranks[heading][0] + 1,
+            'historical_circulation': circulation_ranks[heading][1],
+            'historical_circulation_rank': circulation_ranks[heading][0] + 1,
+            'historical_circulation_normalized': normalized_circulation_ranks[heading][1],
+            'historical_circulation_normalized_rank': normalized_circulation_ranks[heading][0] + 1,
+            'normalized_trend': get_trend(resource_item_data, resource_lengths, normalized=True),
+            'total': len(resources_by_historical_circulation)
+        })
+
+    return statistics
 
-    series = tokenizers['series'].texts_to_sequences(
-        [ml_pred_item.get_feature('series')])[0]
-    series = pad_sequence(series, field_lengths['series'])
-    X3.append(series)
 
-    subject = tokenizers['subjects'].texts_to_sequences(
-        [ml_pred_item.get_feature('subjects')])[0]
-    subject = pad_sequence(subject, field_lengths['subjects'])
-    X4.append(subject)
+def build_entity_statistics(session, types=None):
+    """
+    Materializes statistics of resources to entity statistics table. Needs to be run
+    after the database has been built and every time the data in it changes. Only the
+    offline scripts call this, as it gives the statistics a new version that clears the
+    statistics caches of API processes.
+
+    :param session: database session
+    :param types: types of resources to refresh, by default all types are refreshed
+    """
+    EntityStatistic.__table__.create(session.get_bind(), checkfirst=True)
+
+    if types is None:
+        types = ENTITY_HEADINGS.keys()
 
-    publisher = tokenizers['publisher'].texts_to_sequences(
-        [ml_pred_item.get_feature('publishers')])[0]
-    publisher = pad_sequence(publisher, field_lengths['publishers'])
-    X5.append(publisher)
+    circulation = open_circulation_matrix(session)
 
-    X1 = np.array(X1)
-    X2 = np.array(X2)
-    X3 = np.array(X3)
-    X4 = np.array(X4)
-    X5 = np.array(X5)
+    for t in types:
+        statistics = calculate_entity_statistics(t, ENTITY_HEADINGS[t], session, circulation)
+        session.query(EntityStatistic).filter(EntityStatistic.entity_type == t).delete()
+        session.bulk_insert_mappings(EntityStatistic, statistics)
 
-    prediction = model.predict([X1, X2, X3, X4, X5])
-    return np.argmax(prediction, axis=1)[0]
+    save_statistics_version(session)
+    session.commit()
 
 
-def get_resource_statistics(i, t, h, session, tokenizer):
+def get_entity_statistic(i, t, session, lookups=None):
+    """
+    Returns materialized statistics of a resource or None if resource has no statistics.
+    Statistics are only read here, they are built by ml/build_db.py, ml/update_db.py and
+    ml/build_statistics.py. Statistics are read through the statistics cache of the process.
+
+    :param i: id of resource
+    :param t: type of resource
+    :param session: database session
+    :param lookups: optional dictionary for sharing lookups between multiple recommendations
+    """
+    if lookups is not None:
+        if (t, str(i)) not in lookups:
+            lookups[(t, str(i))] = get_entity_statistic(i, t, session)
+        return lookups[(t, str(i))]
+
+    found, statistic = STATISTICS_CACHE.get((t, str(i)))
+    if found:
+        return statistic
+
+    statistic = session.query(EntityStatistic).filter(
+        EntityStatistic.entity_type == t, EntityStatistic.entity_id == i).first()
+
+    # Cached statistics are detached so they outlive the session of the request
+    if statistic is not None:
+        session.expunge(statistic)
+
+    STATISTICS_CACHE.put((t, str(i)), statistic)
+    return statistic
+
+
+def statistic_to_dict(statistic, tokenizer):
+    """
+    Returns materialized statistics of a resource in the form used in recommendations.
+
+    :param statistic: EntityStatistic-class object
+    :param tokenizer: tokenizer used to extract features
+    """
+    return {
+        'heading': statistic.heading,
+        'current_itemcount': statistic.current_itemcount,
+        'historical_itemcount': statistic.historical_itemcount,
+        'historical_itemcount_rank': statistic.historical_itemcount_rank,
+        'historical_circulation': statistic.historical_circulation,
+        'historical_circulation_rank': statistic.historical_circulation_rank,
+        'historical_circulation_normalized': statistic.historical_circulation_normalized,
+        'historical_circulation_normalized_rank': statistic.historical_circulation_normalized_rank,
+        'normalized_trend': statistic.normalized_trend,
+        'total': statistic.total,
+        'ml_feature': was_usable_feature(statistic.heading, tokenizer)
+    }
+
+
+def get_resource_statistics(i, t, h, session, tokenizer, lookups=None):
     """
     Returns statistics regarding the input resource.
 
@@ -280,66 +455,27 @@ def get_resource_statistics(i, t, h, session, tokenizer):
     :param h: label of heading in database
     :param session: database session
     :param tokenizer: tokenizer used to extract features
+    :param lookups: optional dictionary for sharing lookups between multiple recommendations
     """
-    resource = session.query(eval(t)).filter(eval(t).id == i).first()
+    statistic = get_entity_statistic(i, t, session, lookups)
 
-    if resource == None:
+    if statistic == None:
         return get_newitem_score(i, t)
 
-    if t == 'Series':
-        resources_by_historical_itemcount = session.query(eval(t).label, func.count(DBItem.id)).join(
-            DBItem, eval(t).items).group_by(eval(t).id).order_by(func.count(DBItem.id).desc())
-        resources_by_historical_circulation = calculate_totals(session.query(
-            eval(t).label, DBItem.circulation_sequence).join(DBItem, eval(t).items).all())
-        resource_item_data = session.query(DBItem.circulation_sequence).join(
-            DBItem, eval(t).items).filter(eval(t).id == i, DBItem.deleted == None).all()
-    else:
-        resources_by_historical_itemcount = session.query(eval(f'{t}.{h}'), func.count(
-            DBItem.id)).outerjoin(DBItem).group_by(eval(t).id).order_by(func.count(DBItem.id).desc())
-        resources_by_historical_circulation = calculate_totals(session.query(
-            eval(f'{t}.{h}'), DBItem.circulation_sequence).outerjoin(DBItem).all())
-        resource_item_data = session.query(DBItem.circulation_sequence).filter(
-            eval(f'DBItem.{t.lower()}_id') == resource.id, DBItem.deleted == None).all()
-
-    resource_rank_historical_itemcount = [(x, y[1]) for x, y in enumerate(
-        resources_by_historical_itemcount) if y[0] == getattr(resource, h)][0]
-    resource_rank_historical_circulation = [(x, y[1]) for x, y in enumerate(
-        resources_by_historical_circulation) if y[0] == getattr(resource, h)][0]
-
-    resources_by_normalized_historical_circulation = calculate_normalized_totals(
-        resources_by_historical_itemcount, resources_by_historical_circulation)
-    resource_rank_normalized_historical_circulation = [(x, y[1]) for x, y in enumerate(
-        resources_by_normalized_historical_circulation) if y[0] == getattr(resource, h)][0]
-
-    resource_item_data = [x[0] for x in resource_item_data]
-    resource_current_itemcount = len(resource_item_data)
-    resource_trend = get_trend(resource_item_data, normalized=True)
-
+    res = statistic_to_dict(statistic, tokenizer)
     resource_score = calculate_feature_score(
-        resource_rank_historical_itemcount[0], resource_rank_normalized_historical_circulation[0], len(resources_by_historical_circulation))
+        statistic.historical_itemcount_rank - 1, statistic.historical_circulation_normalized_rank - 1, statistic.total)
 
-    if sum(resource_trend) <= 0 and resource_score['total_score'] > -2:
+    if sum(statistic.normalized_trend) <= 0 and resource_score['total_score'] > -2:
         resource_score['normalized_circulation_score'] -= 1
         resource_score['total_score'] -= 1
         resource_score['stars'] -= 1
 
-    return {
-        'heading': getattr(resource, h),
-        'current_itemcount': resource_current_itemcount,
-        'historical_itemcount': resource_rank_historical_itemcount[1],
-        'historical_itemcount_rank': resource_rank_historical_itemcount[0] + 1,
-        'historical_circulation': resource_rank_historical_circulation[1],
-        'historical_circulation_rank': resource_rank_historical_circulation[0] + 1,
-        'historical_circulation_normalized': resource_rank_normalized_historical_circulation[1],
-        'historical_circulation_normalized_rank': resource_rank_normalized_historical_circulation[0] + 1,
-        'normalized_trend': resource_trend,
-        'total': len(resources_by_historical_circulation),
-        'ml_feature': was_usable_feature(getattr(resource, h), tokenizer),
-        'score': resource_score
-    }
+    res['score'] = resource_score
+    return res
 
 
-def get_listresource_statistics(i, t, h, session, tokenizer):
+def get_listresource_statistics(i, t, h, session, tokenizer, lookups=None):
     """
     Returns statistics regarding the input resource (for joined arrays).
 
@@ -348,68 +484,39 @@ def get_listresource_statistics(i, t, h, session, tokenizer):
     :param h: label of heading in database
     :param session: database session
     :param tokenizer: tokenizer used to extract features for ML prediction
+    :param lookups: optional dictionary for sharing lookups between multiple recommendations
     """
     ml_pred_resources = []
     resources = i.split(' ')
     res = {}
     res['items'] = []
 
-    resources_by_historical_itemcount = session.query(eval(t).label, func.count(DBItem.id)).join(
-        DBItem, eval(t).items).group_by(eval(t).id).order_by(func.count(DBItem.id).desc())
-    resources_by_historical_circulation = calculate_totals(session.query(
-        eval(t).label, DBItem.circulation_sequence).join(DBItem, eval(t).items).all())
-    resources_by_normalized_historical_circulation = calculate_normalized_totals(
-        resources_by_historical_itemcount, resources_by_historical_circulation)
-
     for r in resources:
-        resource = session.query(eval(t)).filter(eval(t).id == r).first()
-        if resource == None:
+        statistic = get_entity_statistic(r, t, session, lookups)
+        if statistic == None:
             res['items'].append(get_newitem_score(r, t))
             continue
 
-        # This creates overhead - optimize this
-        resource_rank_historical_itemcount = [(x, y[1]) for x, y in enumerate(
-            resources_by_historical_itemcount) if y[0] == getattr(resource, h)][0]
-        resource_rank_historical_circulation = [(x, y[1]) for x, y in enumerate(
-            resources_by_historical_circulation) if y[0] == getattr(resource, h)][0]
-        resource_rank_normalized_historical_circulation = [(x, y[1]) for x, y in enumerate(
-            resources_by_normalized_historical_circulation) if y[0] == getattr(resource, h)][0]
-
-        resource_item_data = session.query(DBItem.circulation_sequence).join(
-            DBItem, eval(t).items).filter(eval(t).id == r, DBItem.deleted == None).all()
-        resource_item_data = [x[0] for x in resource_item_data]
-        resource_current_itemcount = len(resource_item_data)
-        resource_trend = get_trend(resource_item_data, normalized=True)
-
-        res['items'].append({
-            'heading': getattr(resource, h),
-            'current_itemcount': resource_current_itemcount,
-            'historical_itemcount': resource_rank_historical_itemcount[1],
-            'historical_itemcount_rank': resource_rank_historical_itemcount[0] + 1,
-            'historical_circulation': resource_rank_historical_circulation[1],
-            'historical_circulation_rank': resource_rank_historical_circulation[0] + 1,
-            'historical_circulation_normalized': resource_rank_normalized_historical_circulation[1],
-            'historical_circulation_normalized_rank': resource_rank_normalized_historical_circulation[0] + 1,
-            'normalized_trend': resource_trend,
-            'total': len(resources_by_historical_circulation),
-            'ml_feature': was_usable_feature(getattr(resource, h), tokenizer)
-        })
-
-        ml_pred_resources.append(getattr(resource, h))
+        res['items'].append(statistic_to_dict(statistic, tokenizer))
+        ml_pred_resources.append(statistic.heading)
 
     return (res, ml_pred_resources)
 
 
-def get_recommendation(args, session, tokenizers, classifier, field_lengths):
+def get_heuristic_recommendation(args, session, tokenizers, lookups=None):
     """
-    Wraps the overall recommendation process to a single function.
+    Scores item attributes using the heuristics based part of the recommender system.
+    Returns the attribute scores, heuristic total score, item for ML prediction and
+    the number of features usable in ML prediction.
 
     :param args: item attributes/parameters for recommendation
     :param session: database session
-    :param tokenizers: array of tokenizers used to extract features
-    :param classifier: classifier for making ML prediction
-    :param field_lengts: fields lengths for padding features
+    :param tokenizers: array of tokenizers used to extract features, None if they have not been loaded
+    :param lookups: optional dictionary for sharing lookups between multiple recommendations
     """
+    # Without tokenizers no feature is usable in ML prediction
+    if tokenizers is None:
+        tokenizers = dict.fromkeys(['author', 'publisher', 'series', 'genres', 'subjects'])
 
     ml_pred_item = Item(authors=[], publishers=[], series=[],
                         pubyear=2020, genres=[], subjects=[])
@@ -422,7 +529,7 @@ def get_recommendation(args, session, tokenizers, classifier, field_lengths):
     if 'author' in args.keys():
         author_id = args['author']
         res['author'] = get_resource_statistics(
-            author_id, 'Author', 'name', session, tokenizers['author'])
+            author_id, 'Author', 'name', session, tokenizers['author'], lookups)
 
         if res['author']:
             total_score += res['author']['score']['total_score']
@@ -433,7 +540,7 @@ def get_recommendation(args, session, tokenizers, classifier, field_lengths):
     if 'publisher' in args.keys():
         publisher_id = args['publisher']
         res['publisher'] = get_resource_statistics(
-            publisher_id, 'Publisher', 'name', session, tokenizers['publisher'])
+            publisher_id, 'Publisher', 'name', session, tokenizers['publisher'], lookups)
 
         if res['publisher']:
             total_score += res['publisher']['score']['total_score']
@@ -444,7 +551,7 @@ def get_recommendation(args, session, tokenizers, classifier, field_lengths):
     if 'series' in args.keys():
         series_id = args['series']
         res['series'] = get_resource_statistics(
-            series_id, 'Series', 'label', session, tokenizers['series'])
+            series_id, 'Series', 'label', session, tokenizers['series'], lookups)
 
         if res['series']:
             total_score += res['series']['score']['total_score']
@@ -455,7 +562,7 @@ def get_recommendation(args, session, tokenizers, classifier, field_lengths):
     if 'genres' in args.keys():
         genres = args['genres']
         res['genres'], ml_pred_item.genres = get_listresource_statistics(
-            genres, 'Genre', 'label', session, tokenizers['genres'])
+            genres, 'Genre', 'label', session, tokenizers['genres'], lookups)
 
         if res['genres']:
             genres_score = calculate_list_feature_score(res['genres'], 'Genre')
@@ -466,7 +573,7 @@ def get_recommendation(args, session, tokenizers, classifier, field_lengths):
     if 'subjects' in args.keys():
         subjects = args['subjects']
         res['subjects'], ml_pred_item.subjects = get_listresource_statistics(
-            subjects, 'Subject', 'label', session, tokenizers['subjects'])
+            subjects, 'Subject', 'label', session, tokenizers['subjects'], lookups)
 
         if res['subjects']:
             subjects_score = calculate_list_feature_score(
@@ -475,16 +582,121 @@ def get_recommendation(args, session, tokenizers, classifier, field_lengths):
             total_ml_features += subjects_score['ml_features']
             res['subjects']['score'] = subjects_score
 
-    # ML pred requires minimum amount of available features and certainty
-    if total_ml_features >= MIN_ML_PRED_FEATURES:
-        ml_pred = get_dnn_prediction(ml_pred_item, classifier, tokenizers, field_lengths)
-        res['ml'] = {'prediction': int(ml_pred)}
+    return res, total_score, ml_pred_item, total_ml_features
 
-        if ml_pred == 1:
-            total_score += 1
-        else:
-            total_score -= 1
 
-    res['recommendation_score'] = total_score
+def finish_recommendations(heuristics, classifier, tokenizers, field_lengths):
+    """
+    Completes recommendations from results of get_heuristic_recommendation. ML predictions
+    are made for all eligible items at once and added to the recommendation scores.
+    Recommendations are based on heuristics only if classifier has not been loaded.
 
-    return res
+    :param heuristics: results of get_heuristic_recommendation for each item
+    :param classifier: classifier for making ML prediction, None if it has not been loaded
+    :param tokenizers: array of tokenizers used to extract features
+    :param field_lengts: fields lengths for padding features
+    """
+    results = []
+    total_scores = []
+    ml_pred_items = []
+    ml_pred_idxs = []
+
+    for idx, (res, total_score, ml_pred_item, total_ml_features) in enumerate(heuristics):
+        results.append(res)
+        total_scores.append(total_score)
+
+        # ML pred requires minimum amount of available features and certainty
+        if total_ml_features >= MIN_ML_PRED_FEATURES:
+            ml_pred_items.append(ml_pred_item)
+            ml_pred_idxs.append(idx)
+
+    if len(ml_pred_items) > 0 and classifier is not None:
+        ml_preds = get_dnn_predictions(ml_pred_items, classifier, tokenizers, field_lengths)
+
+        for idx, ml_pred in zip(ml_pred_idxs, ml_preds):
+            results[idx]['ml'] = {'prediction': int(ml_pred)}
+
+            if ml_pred == 1:
+                total_scores[idx] += 1
+            else:
+                total_scores[idx] -= 1
+
+    for res, total_score in zip(results, total_scores):
+        res['recommendation_score'] = total_score
+
+    return results
+
+
+def get_batch_recommendation(items, session, tokenizers, classifier, field_lengths):
+    """
+    Makes recommendations for multiple items. Resource lookups are shared between
+    the items and ML predictions are made for all eligible items at once.
+
+    :param items: list of item attributes/parameters for recommendation
+    :param session: database session
+    :param tokenizers: array of tokenizers used to extract features
+    :param classifier: classifier for making ML prediction
+    :param field_lengts: fields lengths for padding features
+    """
+    STATISTICS_CACHE.validate(session)
+
+    lookups = {}
+    heuristics = [get_heuristic_recommendation(args, session, tokenizers, lookups) for args in items]
+    return finish_recommendations(heuristics, classifier, tokenizers, field_lengths)
+
+
+def load_entity_statistics(session):
+    """
+    Loads materialized statistics of all resources into a dictionary that can be used as
+    lookups of recommendations. Statistics of resource types that have not been built yet
+    are built first. Statistics are detached from the session, so the dictionary can be
+    shared with other processes.
+
+    :param session: database session
+    """
+    EntityStatistic.__table__.create(session.get_bind(), checkfirst=True)
+    built = set(x[0] for x in session.query(EntityStatistic.entity_type).distinct().all())
+    missing = [x for x in ENTITY_HEADINGS.keys() if x not in built]
+
+    if len(missing) > 0:
+        build_entity_statistics(session, missing)
+
+    lookups = {(x.entity_type, str(x.entity_id)): x for x in session.query(EntityStatistic).all()}
+    session.expunge_all()
+    return lookups
+
+
+def parse_recommendation_args(descriptor):
+    """
+    Parses item descriptor of a batch request into the same form as query
+    parameters of a single recommendation request.
+
+    :param descriptor: item attributes in dictionary form
+    """
+    args = {}
+
+    for key in ['author', 'publisher', 'series']:
+        if key in descriptor and descriptor[key] not in [None, '']:
+            args[key] = str(descriptor[key])
+
+    for key in ['genres', 'subjects']:
+        if key in descriptor and descriptor[key]:
+            if isinstance(descriptor[key], list):
+                args[key] = ' '.join([str(x) for x in descriptor[key]])
+            else:
+                args[key] = str(descriptor[key])
+
+    return args
+
+
+def get_recommendation(args, session, tokenizers, classifier, field_lengths):
+    """
+    Wraps the overall recommendation process to a single function.
+
+    :param args: item attributes/parameters for recommendation
+    :param session: database session
+    :param tokenizers: array of tokenizers used to extract features
+    :param classifier: classifier for making ML prediction
+    :param field_lengts: fields lengths for padding features
+    """
+    return get_batch_recommendation([args], session, tokenizers, classifier, field_lengths)[0]
@@ -0,0 +1,156 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append('..')
+from backend.classes.db_item import DBItem
+from backend.ml.ml_conf import CIRCULATION_INDEX_FILE_PATH, CIRCULATION_LOG_START_MONTH, CIRCULATION_LOG_START_YEAR, \
+    CIRCULATION_MATRIX_FILE_PATH, DATA_OBTAINED_MONTH, DATA_OBTAINED_YEAR
+
+
+def month_index(date):
+    """
+    Returns index of the month of date on the month axis of circulation matrix.
+    The axis starts from the month circulation log starts.
+
+    :param date: date to get the month index for
+    """
+    return (date.year - CIRCULATION_LOG_START_YEAR) * 12 + date.month - CIRCULATION_LOG_START_MONTH
+
+
+# Number of months from circulation log start to the month data was obtained
+CIRCULATION_MONTHS = (DATA_OBTAINED_YEAR - CIRCULATION_LOG_START_YEAR) * 12 + \
+    DATA_OBTAINED_MONTH - CIRCULATION_LOG_START_MONTH + 1
+
+
+def build_circulation_matrix(sequences, end_months, months=CIRCULATION_MONTHS):
+    """
+    Places circulation sequences to a matrix where each column is one month of the
+    circulation log. Months that fall outside of the matrix are dropped.
+    Returns the matrix and lengths of sequences.
+
+    :param sequences: circulation sequences in array form
+    :param end_months: month indexes of the last month of each sequence
+    :param months: number of months in the matrix
+    """
+    lengths = np.array([len(x) for x in sequences], dtype=np.int64)
+    matrix = np.zeros((len(sequences), months), dtype=np.int16)
+
+    if lengths.sum() == 0:
+        return matrix, lengths
+
+    values = np.concatenate([np.asarray(x, dtype=np.int16) for x in sequences])
+    rows = np.repeat(np.arange(len(sequences)), lengths)
+    cols = np.repeat(np.asarray(end_months) - lengths + 1, lengths) + \
+        np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    fits = (cols >= 0) & (cols < months)
+
+    matrix[rows[fits], cols[fits]] = values[fits]
+    return matrix, lengths
+
+
+class CirculationMatrix:
+    """
+    Circulation of items as a matrix of items and months of the circulation log.
+    Rows are ordered by item id.
+    """
+
+    def __init__(self, item_ids, matrix, lengths):
+        self.item_ids = item_ids
+        self.matrix = matrix
+        self.lengths = lengths
+
+    def rows(self, item_ids):
+        """
+        Returns circulation and sequence lengths of given items. Items that are not
+        found have no circulation.
+
+        :param item_ids: ids of items
+        """
+        ids = np.array([x if x is not None else -1 for x in item_ids], dtype=np.int64)
+
+        if len(self.item_ids) == 0:
+            return np.zeros((len(ids), self.matrix.shape[1]), dtype=self.matrix.dtype), np.zeros(len(ids), dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(self.item_ids, ids), len(self.item_ids) - 1)
+        found = self.item_ids[positions] == ids
+
+        matrix = self.matrix[positions]
+        matrix[~found] = 0
+        lengths = np.where(found, self.lengths[positions], 0)
+
+        return matrix, lengths
+
+    def save(self, matrix_path=CIRCULATION_MATRIX_FILE_PATH, index_path=CIRCULATION_INDEX_FILE_PATH):
+        """
+        Saves the matrix and its item index as .npy files that can be memory-mapped.
+        Files are replaced atomically so processes that have mapped the old files keep working.
+
+        :param matrix_path: path of the matrix file
+        :param index_path: path of the item index file
+        """
+        index = np.stack([self.item_ids, self.lengths]).astype(np.int64)
+
+        for path, data in [(matrix_path, self.matrix), (index_path, index)]:
+            with open(f'{path}.tmp', 'wb') as fout:
+                np.save(fout, np.ascontiguousarray(data))
+            os.replace(f'{path}.tmp', path)
+
+    @classmethod
+    def open(cls, matrix_path=CIRCULATION_MATRIX_FILE_PATH, index_path=CIRCULATION_INDEX_FILE_PATH):
+        """
+        Opens saved matrix as read-only memory-map. Processes that open the same files
+        share one copy of the data through page cache.
+
+        :param matrix_path: path of the matrix file
+        :param index_path: path of the item index file
+        """
+        matrix = np.load(matrix_path, mmap_mode='r')
+        index = np.load(index_path, mmap_mode='r')
+        return cls(index[0], matrix, index[1])
+
+
+def load_circulation_matrix(session):
+    """
+    Loads circulation sequences of all items in database to a circulation matrix.
+    Sequences of deleted items end to the month of deletion and others to the month
+    data was obtained.
+
+    :param session: database session
+    """
+    data = session.query(DBItem.id, DBItem.circulation_sequence,
+                         DBItem.deleted).order_by(DBItem.id).all()
+
+    item_ids = np.array([x[0] for x in data], dtype=np.int64)
+    sequences = [x[1] if x[1] is not None else [] for x in data]
+    end_months = np.array([month_index(x[2]) if x[2] is not None else CIRCULATION_MONTHS - 1 for x in data],
+                          dtype=np.int64)
+
+    matrix, lengths = build_circulation_matrix(sequences, end_months)
+    return CirculationMatrix(item_ids, matrix, lengths)
+
+
+def export_circulation_matrix(session):
+    """
+    Exports circulation of all items in database for memory-mapping. Needs to be run
+    every time the database is built or updated.
+
+    :param session: database session
+    """
+    load_circulation_matrix(session).save()
+
+
+def open_circulation_matrix(session):
+    """
+    Returns memory-mapped circulation matrix if it has been exported with current
+    configuration, otherwise loads circulation from database.
+
+    :param session: database session
+    """
+    if os.path.isfile(CIRCULATION_MATRIX_FILE_PATH) and os.path.isfile(CIRCULATION_INDEX_FILE_PATH):
+        circulation = CirculationMatrix.open()
+        if circulation.matrix.shape[1] == CIRCULATION_MONTHS:
+            return circulation
+
+    return load_circulation_matrix(session)
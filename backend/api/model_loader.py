@@ -0,0 +1,126 @@
+import os
+import pickle
+import sys
+import threading
+import time
+import traceback
+
+sys.path.append('..')
+from backend.api.recommender_conf import MODEL_LOAD_RETRY_DELAY
+
+# Tokenizers of the DNN model keyed by tokenizer name and their files in models folder
+TOKENIZER_FILES = {
+    'author': 'author_tokenizer.pkl',
+    'publisher': 'publishers_tokenizer.pkl',
+    'series': 'series_tokenizer.pkl',
+    'genres': 'genres_tokenizer.pkl',
+    'subjects': 'subjects_tokenizer.pkl'
+}
+
+
+class ModelLoader:
+    """
+    Loads tokenizers, field lengths and the DNN model in a background thread when they are
+    first needed. Tensorflow is imported only by the loading thread, so the API can serve
+    requests that do not need the model while the model is being loaded. Failed loading is
+    started again when the model is needed after retry_delay seconds.
+    """
+
+    def __init__(self, models_folder='models', retry_delay=MODEL_LOAD_RETRY_DELAY):
+        self.models_folder = models_folder
+        self.retry_delay = retry_delay
+        self.tokenizers = None
+        self.field_lengths = None
+        self.model = None
+        self.error = None
+        self.failed_at = None
+        self.ready = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts loading in a background thread unless loading has already been started.
+        Loading is started again if the previous attempt failed over retry_delay seconds ago.
+        """
+        with self.lock:
+            retry = (self.failed_at is not None and not self.thread.is_alive()
+                     and time.monotonic() - self.failed_at >= self.retry_delay)
+
+            if self.thread is None or retry:
+                self.failed_at = None
+                self.thread = threading.Thread(target=self.load, name='model-loader', daemon=True)
+                self.thread.start()
+
+    def load(self):
+        """
+        Loads tokenizers, field lengths and the DNN model. Everything is published at once
+        after all of them have been loaded.
+        """
+        try:
+            os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+            import tensorflow as tf
+            from tensorflow import keras
+
+            # Make Keras reserve less GPU memory if using GPU
+            gpus = tf.config.experimental.list_physical_devices('GPU')
+            if gpus:
+                try:
+                    for gpu in gpus:
+                        tf.config.experimental.set_memory_growth(gpu, True)
+                except RuntimeError as e:
+                    print(e)
+
+            tokenizers = {}
+            for name, filename in TOKENIZER_FILES.items():
+                with open(os.path.join(self.models_folder, filename), 'rb') as fin:
+                    tokenizers[name] = pickle.load(fin)
+
+            with open(os.path.join(self.models_folder, 'field_lengths.pkl'), 'rb') as fin:
+                field_lengths = pickle.load(fin)
+
+            model = keras.models.load_model(os.path.join(self.models_folder, 'dnn'))
+            keras.backend.clear_session()
+
+            self.tokenizers, self.field_lengths, self.model = tokenizers, field_lengths, model
+            self.error = None
+            self.ready.set()
+        except Exception as e:
+            traceback.print_exc()
+            self.error = f'{type(e).__name__}: {e}'
+            self.failed_at = time.monotonic()
+
+    def get(self):
+        """
+        Returns tokenizers, DNN model and field lengths. Starts loading them on first call
+        or after a failed attempt and returns None for all of them until they have been loaded.
+        """
+        self.start()
+
+        if not self.ready.is_set():
+            return None, None, None
+
+        return self.tokenizers, self.model, self.field_lengths
+
+    def status(self):
+        """
+        Returns status of loading. Error of the latest failed attempt is kept until loading
+        succeeds.
+        """
+        loading = self.thread is not None and self.thread.is_alive()
+
+        if self.ready.is_set():
+            state = 'ready'
+        elif loading:
+            state = 'loading'
+        elif self.error is not None:
+            state = 'failed'
+        else:
+            state = 'not started'
+
+        return {
+            'ready': self.ready.is_set(),
+            'state': state,
+            'loading': loading,
+            'error': self.error
+        }
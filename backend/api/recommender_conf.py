@@ -6,3 +6,15 @@ BOTTOM_RANK_PERCENTILE = 50  # This percentile gains -1 to total score
 MIN_ML_PRED_FEATURES = 5  # Minimum features to have in order to include ML score
 ML_CLASS1_CONFIDENCE = 0.6  # Threshold for class 1 ML prediction
 ML_CLASS0_CONFIDENCE = 0.4  # Threshold for class 2 ML prediction
+
+# API conf
+MAX_BATCH_RECOMMENDATIONS = 5000  # Maximum number of items in one batch recommendation request
+MODEL_LOAD_RETRY_DELAY = 60  # Seconds before loading the DNN model is tried again after loading has failed
+
+# Cache conf
+STATISTICS_CACHE_SIZE = 20000  # Maximum number of entity statistics cached by one API process
+STATISTICS_CACHE_TTL = 3600  # Seconds entity statistics are cached before they are read again
+
+# Evaluation conf
+EVALUATION_PROCESSES = None  # Processes scoring test items in api/test_recommender.py, None uses all cores
+EVALUATION_CHUNK_SIZE = 500  # Test items scored together by one process
@@ -0,0 +1,118 @@
+import sys
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+
+sys.path.append('..')
+from backend.classes.metadata import Metadata
+from backend.api.recommender_conf import STATISTICS_CACHE_SIZE, STATISTICS_CACHE_TTL
+
+# Metadata key of the version of entity statistics in database
+STATISTICS_VERSION_KEY = 'statistics_version'
+
+
+def save_statistics_version(session):
+    """
+    Gives entity statistics in database a new version. Caches of API processes are cleared
+    when they notice the version has changed, so the version is changed only when statistics
+    are rebuilt by the offline scripts and never while serving requests. Changes are
+    committed by the caller.
+
+    :param session: database session
+    """
+    Metadata.__table__.create(session.get_bind(), checkfirst=True)
+    session.merge(Metadata(key=STATISTICS_VERSION_KEY, value=uuid.uuid4().hex))
+
+
+def load_statistics_version(session):
+    """
+    Returns version of entity statistics in database or None if statistics have no version.
+
+    :param session: database session
+    """
+    version = session.query(Metadata.value).filter(Metadata.key == STATISTICS_VERSION_KEY).first()
+    return version[0] if version is not None else None
+
+
+class StatisticsCache:
+    """
+    Bounded in-process cache of entity statistics keyed by (entity type, id). Least recently
+    used statistics are evicted when the cache is full and statistics older than ttl seconds
+    are read again from database. Statistics are cached as objects detached from sessions.
+    """
+
+    def __init__(self, max_size=STATISTICS_CACHE_SIZE, ttl=STATISTICS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def validate(self, session):
+        """
+        Clears the cache if statistics in database have been rebuilt since the cache was
+        last validated.
+
+        :param session: database session
+        """
+        version = load_statistics_version(session)
+
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def get(self, key):
+        """
+        Returns a tuple of boolean telling if key was found and the cached statistic.
+
+        :param key: tuple of entity type and id
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+
+                self.misses += 1
+                return False, None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key, statistic):
+        """
+        Adds statistic to cache, evicting the least recently used statistics if cache is full.
+
+        :param key: tuple of entity type and id
+        :param statistic: EntityStatistic-class object or None if entity has no statistics
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic(), statistic)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        """
+        Returns size and hit and miss counts of the cache.
+        """
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -5,12 +5,15 @@ import sys
 
 import numpy as np
 
+from multiprocessing import Pool
 from sklearn import metrics
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 sys.path.append('..')
-from backend.api.api_utils import get_recommendation
+from backend.api.api_utils import finish_recommendations, get_heuristic_recommendation, load_entity_statistics
+from backend.api.model_loader import TOKENIZER_FILES
+from backend.api.recommender_conf import EVALUATION_CHUNK_SIZE, EVALUATION_PROCESSES
 from backend.ml.metric_utils import save_confusion_matrix
 from backend.ml.ml_utils import load_data_classification
 from backend.ml.ml_conf import PREPROCESS_FILE_PATH
@@ -22,119 +25,188 @@ from backend.classes.biblio import Biblio
 from backend.classes.author import Author
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.preprocessing.text import Tokenizer
-
-
-# Make Keras eat less GPU memory if using GPU
-gpus = tf.config.experimental.list_physical_devices('GPU')
-if gpus:
-  try:
-    for gpu in gpus:
-      tf.config.experimental.set_memory_growth(gpu, True)
-  except RuntimeError as e:
-    print(e)
-
-# DNN setup
-AUTHORS_TOKENIZER = pickle.load(open('models/author_tokenizer.pkl', 'rb'))
-PUBLISHERS_TOKENIZER = pickle.load(open('models/publishers_tokenizer.pkl', 'rb'))
-SERIESS_TOKENIZER = pickle.load(open('models/series_tokenizer.pkl', 'rb'))
-GENRES_TOKENIZER = pickle.load(open('models/genres_tokenizer.pkl', 'rb'))
-SUBJECTS_TOKENIZER = pickle.load(open('models/subjects_tokenizer.pkl', 'rb'))
+
+DATABASE_URL = 'sqlite:///data/recommender.db'
+
 FIELD_LENGTHS = pickle.load(open('models/field_lengths.pkl', 'rb'))
-MODEL = keras.models.load_model('models/dnn')
-TOKENIZERS = {
-    'author': AUTHORS_TOKENIZER,
-    'publisher': PUBLISHERS_TOKENIZER,
-    'series': SERIESS_TOKENIZER,
-    'genres': GENRES_TOKENIZER,
-    'subjects': SUBJECTS_TOKENIZER
-}
-keras.backend.clear_session()
-
-def get_req(item, session):
+
+
+def load_tokenizers():
+    """
+    Loads tokenizers of the DNN model. Unpickling Keras tokenizers imports Tensorflow, so
+    tokenizers are loaded by worker processes and by the main process only after workers
+    have finished.
+    """
+    tokenizers = {}
+
+    for name, filename in TOKENIZER_FILES.items():
+        with open(os.path.join('models', filename), 'rb') as fin:
+            tokenizers[name] = pickle.load(fin)
+
+    return tokenizers
+
+
+def load_model():
+    """
+    Loads the DNN model. Model is loaded only after items have been scored by worker
+    processes, as processes should not be forked after Tensorflow has started its threads.
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    # Make Keras eat less GPU memory if using GPU
+    gpus = tf.config.experimental.list_physical_devices('GPU')
+    if gpus:
+        try:
+            for gpu in gpus:
+                tf.config.experimental.set_memory_growth(gpu, True)
+        except RuntimeError as e:
+            print(e)
+
+    return keras.models.load_model('models/dnn')
+
+
+def load_entity_ids(session):
+    """
+    Returns dictionaries from headings to database ids of authors, publishers, series, genres
+    and subjects. If multiple resources share a heading, the one with the smallest id is used.
+
+    :param session: database session
+    """
+    entity_ids = {}
+
+    for key, column in [('author', Author.name), ('publisher', Publisher.name), ('series', Series.label),
+                        ('genres', Genre.label), ('subjects', Subject.label)]:
+        ids = {}
+        for heading, i in session.query(column, column.class_.id).order_by(column.class_.id).all():
+            ids.setdefault(heading, i)
+        entity_ids[key] = ids
+
+    return entity_ids
+
+
+def get_req(item, entity_ids):
     """
     Parses http-request like information from Item object
 
     :param item: Item-object to parse request-like dict from
-    :param session: database session
+    :param entity_ids: dictionaries from headings to database ids returned by load_entity_ids
     """
     req = {}
 
     if len(item.authors) > 0:
-        db_author = session.query(Author).filter(
-            Author.name == item.authors[0]).first()
+        db_author = entity_ids['author'].get(item.authors[0])
         if db_author == None:
             req['author'] = item.authors[0].replace(' ', '_')
         else:
-            req['author'] = db_author.id
+            req['author'] = db_author
 
     if len(item.publishers) > 0:
-        db_publisher = session.query(Publisher).filter(
-            Publisher.name == item.publishers[0]).first()
+        db_publisher = entity_ids['publisher'].get(item.publishers[0])
         if db_publisher == None:
             req['publisher'] = item.publishers[0].replace(' ', '_')
         else:
-            req['publisher'] = db_publisher.id
+            req['publisher'] = db_publisher
 
     if len(item.series) > 0:
-        db_series = session.query(Series).filter(
-            Series.label == item.series[0]).first()
+        db_series = entity_ids['series'].get(item.series[0])
         if db_series == None:
             req['series'] = item.series[0].replace(' ', '_')
         else:
-            req['series'] = db_series.id
+            req['series'] = db_series
 
     if len(item.genres) > 0:
         genres = []
         for g in item.genres:
-            db_genre = session.query(Genre).filter(Genre.label == g).first()
+            db_genre = entity_ids['genres'].get(g)
             if db_genre == None:
                 genres.append(str(g).replace(' ', '_'))
             else:
-                genres.append(str(db_genre.id))
+                genres.append(str(db_genre))
         req['genres'] = ' '.join(genres)
 
     if len(item.subjects) > 0:
         subjects = []
         for s in item.subjects:
-            db_subject = session.query(Subject).filter(
-                Subject.label == s).first()
+            db_subject = entity_ids['subjects'].get(s)
             if db_subject == None:
                 subjects.append(str(s).replace(' ', '_'))
             else:
-                subjects.append(str(db_subject.id))
+                subjects.append(str(db_subject))
         req['subjects'] = ' '.join(subjects)
 
     return req
 
 
-def recommend(i, session, tokenizer, classifier, field_lengths):
+shared_session = None
+shared_lookups = None
+shared_tokenizers = None
+
+
+def init_evaluation_worker(lookups):
     """
-    Makes the prediction/recommendation using the overall recommender system.
+    Initializer of evaluation worker processes. Each worker opens its own database
+    connection, loads the tokenizers needed by the heuristics and gets the preloaded
+    entity statistics once.
 
-    :param i: item that recommendation is based on
-    :param session: database session
-    :param tokenizer: tokenizer for tokenizing features
-    :param classifier: classifier to be used for ML prediction
+    :param lookups: entity statistics returned by load_entity_statistics
+    """
+    global shared_session, shared_lookups, shared_tokenizers
+    shared_session = sessionmaker(bind=create_engine(DATABASE_URL, echo=False))()
+    shared_lookups = lookups
+    shared_tokenizers = load_tokenizers()
+
+
+def score_chunk(reqs):
+    """
+    Helper function for multiprocessing. Scores a chunk of requests with the heuristics
+    based part of the recommender system.
+
+    :param reqs: request-like dicts of items
+    """
+    return [get_heuristic_recommendation(x, shared_session, shared_tokenizers, shared_lookups) for x in reqs]
+
+
+def recommend_all(reqs, lookups, processes=EVALUATION_PROCESSES):
+    """
+    Makes recommendations for all requests. Heuristic scores are calculated in parallel
+    worker processes and ML predictions are made for all items at once afterwards.
+
+    :param reqs: request-like dicts of items
+    :param lookups: entity statistics returned by load_entity_statistics
+    :param processes: amount of worker processes, None uses all available cores
+    """
+    chunks = [reqs[i:i + EVALUATION_CHUNK_SIZE] for i in range(0, len(reqs), EVALUATION_CHUNK_SIZE)]
+    heuristics = []
+
+    with Pool(processes, initializer=init_evaluation_worker, initargs=(lookups,)) as p:
+        for chunk_heuristics in p.imap(score_chunk, chunks):
+            heuristics.extend(chunk_heuristics)
+
+    return finish_recommendations(heuristics, load_model(), load_tokenizers(), FIELD_LENGTHS)
+
+
+def recommendation_class(recommendation):
+    """
+    Returns class of the recommendation based on its score.
+
+    :param recommendation: recommendation made by the overall recommender system
     """
-    recommendation = get_recommendation(i, session, tokenizer, classifier, field_lengths)
     final_score = recommendation['recommendation_score']
 
     if final_score > 1:
-        return (1, recommendation)
+        return 1
     elif final_score < 0:
-        return (-1, recommendation)
+        return -1
     else:
-        return (0, recommendation)
+        return 0
 
 
 if __name__ == "__main__":
     """
     This script tests the overall recommender system accuracy.
     """
-    engine = create_engine(f'sqlite:///data/recommender.db', echo=False)
+    engine = create_engine(DATABASE_URL, echo=False)
     Session = sessionmaker(bind=engine)
     session = Session()
 
@@ -150,18 +222,19 @@ if __name__ == "__main__":
     for class_, count in zip(class_distribution[0], class_distribution[1]):
         print(f'  class {class_}: {count} items')
 
-    X_test = [get_req(x, session) for x in X_test]
-    results = []
+    entity_ids = load_entity_ids(session)
+    X_test = [get_req(x, entity_ids) for x in X_test]
 
-    y_rec = []
+    lookups = load_entity_statistics(session)
+    session.close()
+    engine.dispose()
 
-    for i, sample in enumerate(X_test):
-        recommendation = recommend(sample, session, TOKENIZERS, MODEL, FIELD_LENGTHS)
-        y_rec.append(recommendation[0])
+    results = recommend_all(X_test, lookups)
+    y_rec = []
 
-        r = recommendation[1]
+    for i, r in enumerate(results):
+        y_rec.append(recommendation_class(r))
         r['true_class'] = int(y_test[i])
-        results.append(r)
 
     y_rec = np.array(y_rec)
     accuracy = metrics.accuracy_score(y_test, y_rec)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+
+class CirculationSequence(TypeDecorator):
+    """
+    Stores circulation sequence as a little-endian int16 array. Values are read
+    back as a numpy array without unpickling.
+    """
+    impl = LargeBinary
+    dtype = np.dtype('<i2')
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+
+        sequence = np.asarray(value)
+        if sequence.size > 0 and (sequence.min() < np.iinfo(self.dtype).min or sequence.max() > np.iinfo(self.dtype).max):
+            raise ValueError('Circulation sequence has values that do not fit to 16 bits')
+
+        return sequence.astype(self.dtype).tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+
+        return np.frombuffer(value, dtype=self.dtype)
@@ -1,5 +1,6 @@
 from backend.classes.base import Base
-from sqlalchemy import Column, Date, ForeignKey, Integer, PickleType, String, Table, Text
+from backend.classes.circulation_sequence import CirculationSequence
+from sqlalchemy import Column, Date, ForeignKey, Integer, String, Table, Text
 from sqlalchemy.orm import relationship
 
 # Association tables
@@ -22,7 +23,7 @@ class DBItem(Base):
     pub_year = Column(Integer)
     acquired = Column(Date)
     last_borrowed = Column(Date)
-    circulation_sequence = Column(PickleType)
+    circulation_sequence = Column(CirculationSequence)
     deleted = Column(Date)
     author = relationship('Author')
     author_id = Column(Integer, ForeignKey('authors.id'))
@@ -0,0 +1,22 @@
+from backend.classes.base import Base
+from sqlalchemy import Column, Float, Integer, PickleType, String
+
+
+class EntityStatistic(Base):
+    __tablename__ = 'entity_statistics'
+
+    entity_type = Column(String, primary_key=True)
+    entity_id = Column(Integer, primary_key=True)
+    heading = Column(String)
+    current_itemcount = Column(Integer)
+    historical_itemcount = Column(Integer)
+    historical_itemcount_rank = Column(Integer)
+    historical_circulation = Column(Integer)
+    historical_circulation_rank = Column(Integer)
+    historical_circulation_normalized = Column(Float)
+    historical_circulation_normalized_rank = Column(Integer)
+    normalized_trend = Column(PickleType)
+    total = Column(Integer)
+
+    def __repr__(self):
+        return f'<EntityStatistic(type={self.entity_type}, id={self.entity_id}, heading={self.heading})>'
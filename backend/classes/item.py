@@ -1,8 +1,20 @@
+import copy
 import os
 
+import numpy as np
+
+# Features of items that are lists of strings
+LIST_FEATURES = ('authors', 'publishers', 'series', 'genres', 'subjects')
+
 
 class Item:
+    __slots__ = ('bib_id', 'item_id', 'authors', 'title', 'publishers', 'series', 'pubyear', 'acquired', 'deleted',
+                 'last_borrowed', 'genres', 'subjects', 'circulation_sequence', 'feature_vectors', 'comparison_sequence',
+                 '_features', '_token_ids')
+
     def __init__(self, bib_id=None, item_id=None, authors=None, title=None, publishers=None, series=None, pubyear=None, acquired=None, deleted=None, genres=None, subjects=None, last_borrowed=None):
+        self.invalidate_features()
+
         self.bib_id = bib_id
         self.item_id = item_id
         self.authors = authors
@@ -20,8 +32,49 @@ class Item:
         self.feature_vectors = None
         self.comparison_sequence = None
 
+    def __setattr__(self, key, value):
+        object.__setattr__(self, key, value)
+
+        if key in LIST_FEATURES:
+            self.invalidate_features()
+
+    def invalidate_features(self):
+        """
+        Clears cached feature strings and token ids. Assigning a feature list does this automatically,
+        call this if a feature list is modified in place.
+        """
+        object.__setattr__(self, '_features', None)
+        object.__setattr__(self, '_token_ids', None)
+
     def get_feature(self, feature):
-        return '#'.join(getattr(self, feature)).replace(' ', '_')
+        if self._features is None:
+            object.__setattr__(self, '_features', {})
+
+        encoded = self._features.get(feature)
+
+        if encoded is None:
+            encoded = '#'.join(getattr(self, feature)).replace(' ', '_')
+            self._features[feature] = encoded
+
+        return encoded
+
+    def get_token_ids(self, feature, word_index):
+        """
+        Returns ids of a feature in vocabulary of a tokenizer. Values missing from the vocabulary are skipped.
+
+        :param feature: name of the feature (e.g. authors)
+        :param word_index: vocabulary of the tokenizer
+        """
+        if self._token_ids is None:
+            object.__setattr__(self, '_token_ids', {})
+
+        cached = self._token_ids.get(feature)
+
+        if cached is None or cached[0] is not word_index:
+            cached = (word_index, [word_index[x] for x in self.get_feature(feature).split('#') if x in word_index])
+            self._token_ids[feature] = cached
+
+        return cached[1]
 
     def set_circulation_sequence(self, circulation_sequence):
         self.circulation_sequence = circulation_sequence
@@ -30,10 +83,18 @@ class Item:
         self.feature_vectors = feature_vectors
 
     def get_feature_string(self):
-        features = self.authors + self.publishers + \
-            self.genres + self.subjects + self.series
-        features = '#'.join(features)
-        features = features.replace(' ', '_')
+        if self._features is None:
+            object.__setattr__(self, '_features', {})
+
+        features = self._features.get('all')
+
+        if features is None:
+            features = self.authors + self.publishers + \
+                self.genres + self.subjects + self.series
+            features = '#'.join(features)
+            features = features.replace(' ', '_')
+            self._features['all'] = features
+
         return features
 
     def get_feature_idxs(self, item):
@@ -56,6 +117,20 @@ class Item:
 
         return feature_counts
 
+    def without_feature(self, feature, i):
+        """
+        Returns a copy of item with one value of a feature dropped. Other attributes, including
+        circulation sequence, are shared with this item instead of copied.
+
+        :param feature: name of the feature (e.g. authors)
+        :param i: index of the value to drop
+        """
+        item = copy.copy(self)
+        values = list(self[feature])
+        values.remove(values[i])
+        item[feature] = values
+        return item
+
     def filter_features(self, features):
         self.authors, self.publishers, self.genres, self.subjects, self.series = (
             [] for i in range(5))
@@ -72,6 +147,7 @@ class Item:
             elif f in self.series:
                 self.series.append(f)
 
+        self.invalidate_features()
         return self.get_feature_count()
 
     def __str__(self):
@@ -100,3 +176,18 @@ class Item:
 
     def __getitem__(self, key):
         return getattr(self, key)
+
+    def __getstate__(self):
+        # Cached features are not pickled, state has the same form as items pickled before slots
+        return {x: getattr(self, x, None) for x in self.__slots__ if not x.startswith('_')}
+
+    def __setstate__(self, state):
+        # Slotted objects are pickled as (None, slots) by default protocols
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+
+        self.invalidate_features()
+
+        for x in self.__slots__:
+            if not x.startswith('_'):
+                object.__setattr__(self, x, state.get(x))
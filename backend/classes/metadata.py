@@ -0,0 +1,9 @@
+from backend.classes.base import Base
+from sqlalchemy import Column, String
+
+
+class Metadata(Base):
+    __tablename__ = 'metadata'
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
@@ -1,28 +1,56 @@
-import pickle
 import sys
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import relationship, backref, sessionmaker
 
 sys.path.append('..')
 
-from backend.ml.ml_conf import PREPROCESS_FILE_PATH
+from backend.api.api_utils import build_entity_statistics
+from backend.api.circulation import export_circulation_matrix
+from backend.ml.item_dataset import load_items
+from backend.ml.ml_conf import DATA_OBTAINED_MONTH, DATA_OBTAINED_YEAR, PREPROCESS_FILE_PATH
 from backend.classes.subject import Subject
 from backend.classes.serie import Series
 from backend.classes.publisher import Publisher
 from backend.classes.genre import Genre
-from backend.classes.db_item import DBItem
+from backend.classes.db_item import DBItem, item_genre, item_serie, item_subject
+from backend.classes.entity_statistic import EntityStatistic
 from backend.classes.biblio import Biblio
+from backend.classes.metadata import Metadata
 from backend.classes.base import Base
 from backend.classes.author import Author
 
+# SQLite settings for building the database from scratch. Journal and syncing
+# to disk are turned off as a failed build is started again from the beginning.
+BULK_LOAD_PRAGMAS = [
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -512000'
+]
 
-def save_item(item, session):
+
+def use_bulk_load_pragmas(engine):
+    """
+    Applies bulk load settings to every connection of the engine.
+
+    :param engine: database engine
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in BULK_LOAD_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def save_item(item, session, commit=True):
     """
     Saves an item to database.
 
     :param item: Item-class object to save to database
     :param session: database session
+    :param commit: whether to commit the item right away
     """
 
     # Sanity check if item already in db
@@ -71,8 +99,8 @@ def save_item(item, session):
             session.flush()
         db_publisher.items.append(db_item)
 
-    # Process genre
-    for genre in item.genres:
+    # Process genre, a label repeated in the item is linked to it only once
+    for genre in dict.fromkeys(item.genres):
         db_genre = session.query(Genre).filter(Genre.label == genre).first()
         if not db_genre:
             db_genre = Genre(label=genre)
@@ -82,7 +110,7 @@ def save_item(item, session):
         db_genre.items.append(db_item)
 
     # Process series
-    for serie in item.series:
+    for serie in dict.fromkeys(item.series):
         db_series = session.query(Series).filter(Series.label == serie).first()
         if not db_series:
             db_series = Series(label=serie)
@@ -92,7 +120,7 @@ def save_item(item, session):
         db_series.items.append(db_item)
 
     # Process subject terms
-    for subject in item.subjects:
+    for subject in dict.fromkeys(item.subjects):
         db_subject = session.query(Subject).filter(
             Subject.label == subject).first()
         if not db_subject:
@@ -102,16 +130,122 @@ def save_item(item, session):
 
         db_subject.items.append(db_item)
 
-    session.commit()
+    if commit:
+        session.commit()
     return True
 
 
+def save_circulation_end(session, year=DATA_OBTAINED_YEAR, month=DATA_OBTAINED_MONTH):
+    """
+    Saves the last month of circulation data in database. Incremental updates
+    continue circulation sequences from the month after it.
+
+    :param session: database session
+    :param year: year of the last month
+    :param month: last month
+    """
+    session.merge(Metadata(key='circulation_end', value=f'{year}-{month}'))
+    session.commit()
+
+
+def load_circulation_end(session):
+    """
+    Returns the last month of circulation data in database as (year, month) or None if unknown.
+
+    :param session: database session
+    """
+    circulation_end = session.query(Metadata).filter(Metadata.key == 'circulation_end').first()
+
+    if circulation_end is None:
+        return None
+
+    year, month = circulation_end.value.split('-')
+    return int(year), int(month)
+
+
+def bulk_save_items(items, session):
+    """
+    Saves items to an empty database in bulk. Entities are deduplicated and given ids in
+    memory in the same order save_item would give them, and all rows are inserted with
+    executemany inside a single transaction.
+
+    :param items: Item-class objects to save to database
+    :param session: database session
+    """
+    biblios = {}
+    missing_biblios = []
+    authors, publishers, genres, series, subjects = [{} for x in range(5)]
+    db_items, item_genres, item_series, item_subjects = [[] for x in range(4)]
+    saved_item_ids = set()
+
+    def get_entity_id(entities, label):
+        if label not in entities:
+            entities[label] = len(entities) + 1
+        return entities[label]
+
+    for item in items:
+        # Sanity check if item already saved
+        if item.item_id in saved_item_ids:
+            continue
+        saved_item_ids.add(item.item_id)
+
+        if item.bib_id is None:
+            missing_biblios.append((len(db_items), item.title))
+        elif item.bib_id not in biblios:
+            biblios[item.bib_id] = item.title
+
+        db_items.append({
+            'id': item.item_id,
+            'acquired': item.acquired,
+            'title': item.title,
+            'pub_year': item.pubyear,
+            'deleted': item.deleted,
+            'circulation_sequence': item.circulation_sequence,
+            'last_borrowed': item.last_borrowed,
+            'bib_id': item.bib_id,
+            'author_id': get_entity_id(authors, item.authors[0]) if len(item.authors) > 0 else None,
+            'publisher_id': get_entity_id(publishers, item.publishers[0]) if len(item.publishers) > 0 else None
+        })
+
+        for genre in dict.fromkeys(item.genres):
+            item_genres.append({'item_id': item.item_id, 'genre_id': get_entity_id(genres, genre)})
+
+        for serie in dict.fromkeys(item.series):
+            item_series.append({'item_id': item.item_id, 'serie_id': get_entity_id(series, serie)})
+
+        for subject in dict.fromkeys(item.subjects):
+            item_subjects.append({'item_id': item.item_id, 'subject_id': get_entity_id(subjects, subject)})
+
+    # Items without a bib id get a biblio of their own like in save_item, ids are given
+    # after the known bib ids so they can not collide with them
+    next_bib_id = max(biblios.keys(), default=0) + 1
+    for idx, title in missing_biblios:
+        biblios[next_bib_id] = title
+        db_items[idx]['bib_id'] = next_bib_id
+        next_bib_id += 1
+
+    session.bulk_insert_mappings(Biblio, [{'id': k, 'title': v} for k, v in biblios.items()])
+    session.bulk_insert_mappings(Author, [{'id': v, 'name': k} for k, v in authors.items()])
+    session.bulk_insert_mappings(Publisher, [{'id': v, 'name': k} for k, v in publishers.items()])
+    session.bulk_insert_mappings(Genre, [{'id': v, 'label': k} for k, v in genres.items()])
+    session.bulk_insert_mappings(Series, [{'id': v, 'label': k} for k, v in series.items()])
+    session.bulk_insert_mappings(Subject, [{'id': v, 'label': k} for k, v in subjects.items()])
+    session.bulk_insert_mappings(DBItem, db_items)
+
+    for table, rows in [(item_genre, item_genres), (item_serie, item_series), (item_subject, item_subjects)]:
+        if len(rows) > 0:
+            session.execute(table.insert(), rows)
+
+    session.commit()
+    print(f'Saved {len(db_items)} items to database')
+
+
 if __name__ == "__main__":
     """
     This script builds database for the recommender system.
-    Takes ~6-7h with 50k records. 
     """
     engine = create_engine(f'sqlite:///data/recommender.db', echo=False)
+    use_bulk_load_pragmas(engine)
 
     Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine, checkfirst=True)
@@ -119,9 +253,14 @@ if __name__ == "__main__":
     Session = sessionmaker(bind=engine)
     session = Session()
 
-    items = pickle.load(open(PREPROCESS_FILE_PATH['db_constructing'], 'rb'))
+    items = load_items(PREPROCESS_FILE_PATH['db_constructing'])
+    bulk_save_items(items, session)
+    save_circulation_end(session)
 
-    for item in items:
-        save_item(item, session)
+    print('Exporting circulation matrix')
+    export_circulation_matrix(session)
+
+    print('Building entity statistics')
+    build_entity_statistics(session)
 
     session.close()
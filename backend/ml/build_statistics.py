@@ -0,0 +1,30 @@
+import sys
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append('..')
+
+from backend.api.api_utils import build_entity_statistics
+from backend.api.circulation import export_circulation_matrix
+
+
+if __name__ == "__main__":
+    """
+    This script refreshes the precomputed entity statistics of the recommender
+    database. Statistics are built automatically by build_db.py, run this script
+    if the data in the database has been changed afterwards.
+    """
+    engine = create_engine(f'sqlite:///data/recommender.db', echo=False)
+
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    print('Exporting circulation matrix')
+    export_circulation_matrix(session)
+
+    print('Refreshing entity statistics')
+    build_entity_statistics(session)
+    print('Entity statistics have been refreshed')
+
+    session.close()
@@ -0,0 +1,194 @@
+import math
+import os
+import time
+
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+import numpy as np
+from joblib import parallel_backend
+from scipy import sparse
+from sklearn.feature_selection import mutual_info_classif
+
+from ml_conf import *
+from metric_utils import test_model
+
+# Columns of metrics/accuracies.csv
+METRICS_COLUMNS = ['name', 'accuracy', 'fit_seconds', 'predict_ms_per_item', 'peak_memory_mb']
+
+# Memory is read from /proc, so it is measured only on Linux
+MEASURE_MEMORY = os.path.isfile('/proc/self/clear_refs')
+
+shared_data = None
+
+
+def init_comparison_worker(data):
+    """
+    Initializer of comparison worker processes. Data is handed to each worker once instead
+    of sending it with every task.
+
+    :param data: tuple of data used by the tasks
+    """
+    global shared_data
+    shared_data = data
+
+
+def budget_processes(n_tasks, processes=COMPARISON_PROCESSES):
+    """
+    Divides available cores between tasks run at the same time. Returns the amount of worker
+    processes and the amount of threads each task may use.
+
+    :param n_tasks: amount of independent tasks
+    :param processes: amount of cores to use, None uses all available cores
+    """
+    cores = processes or os.cpu_count()
+    n_processes = max(1, min(n_tasks, cores))
+    return n_processes, max(1, cores // n_processes)
+
+
+class NoOpModel:
+    """
+    Model that predicts class 0 for every item. Used for warming up test_model before
+    memory of a model is measured.
+    """
+    best_iteration = None
+
+    def predict(self, X, **kwargs):
+        return np.zeros(X.shape[0], dtype=int)
+
+
+def read_memory(field):
+    """
+    Returns a memory field of the current process from /proc/self/status in kilobytes,
+    e.g. VmRSS for resident memory and VmHWM for peak resident memory.
+
+    :param field: name of the field
+    """
+    with open('/proc/self/status', 'r') as fin:
+        for line in fin:
+            if line.startswith(f'{field}:'):
+                return int(line.split()[1])
+
+
+def reset_peak_memory():
+    """
+    Resets peak resident memory of the current process to its current resident memory.
+    """
+    with open('/proc/self/clear_refs', 'w') as fout:
+        fout.write('5')
+
+
+def fit_and_test(task):
+    """
+    Helper function for multiprocessing. Fits a model, tests it and returns its metrics.
+    test_model is run with a model that does nothing before measuring, so peak memory
+    counts memory used by fitting and testing the model, not the memory test_model itself
+    needs. Peak memory is approximate and can only be measured on Linux.
+
+    :param task: tuple of model name, function that fits the model and amount of threads for the model
+    """
+    name, fit, n_jobs = task
+    X_train, y_train, X_test, y_test = shared_data
+
+    # Worker processes cannot start processes of their own, so scikit-learn uses threads
+    with parallel_backend('threading', n_jobs=n_jobs):
+        # Memory used for drawing the reports settles only after they have been drawn twice,
+        # as the allocator keeps freed buffers. Warm-up writes the same reports the model's
+        # own test overwrites.
+        if MEASURE_MEMORY:
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                for _ in range(2):
+                    test_model(NoOpModel(), X_test, y_test, name)
+
+            reset_peak_memory()
+            memory_start = read_memory('VmRSS')
+
+        start = time.perf_counter()
+        model = fit(X_train, y_train, X_test, y_test, n_jobs)
+        fit_seconds = time.perf_counter() - start
+
+        metrics = test_model(model, X_test, y_test, name)
+
+    metrics['fit_seconds'] = round(fit_seconds, 2)
+
+    if MEASURE_MEMORY:
+        metrics['peak_memory_mb'] = round((read_memory('VmHWM') - memory_start) / 1024, 1)
+
+    return metrics
+
+
+def run_models(models, X_train, y_train, X_test, y_test, processes=COMPARISON_PROCESSES):
+    """
+    Fits and tests models in parallel worker processes. Cores are divided between the models
+    and each model is given its share as the amount of threads it may use. Returns metrics of
+    models in the same order as models are given.
+
+    :param models: list of model names and functions that fit the models
+    :param X_train: training data
+    :param y_train: training data labels
+    :param X_test: test data
+    :param y_test: test data labels
+    :param processes: amount of cores to use, None uses all available cores
+    """
+    n_processes, n_jobs = budget_processes(len(models), processes)
+    tasks = [(name, fit, n_jobs) for name, fit in models]
+
+    # Each model is fitted in a new process so peak memory of models is measured separately
+    with Pool(n_processes, initializer=init_comparison_worker,
+              initargs=((X_train, y_train, X_test, y_test),), maxtasksperchild=1) as p:
+        return p.map(fit_and_test, tasks)
+
+
+def score_columns(columns):
+    """
+    Helper function for multiprocessing. Scores mutual information of a range of columns.
+
+    :param columns: tuple of first and last column of the range
+    """
+    X, y = shared_data
+    return mutual_info_classif(X[:, columns[0]:columns[1]], y)
+
+
+def mutual_info_parallel(X, y, processes=COMPARISON_PROCESSES):
+    """
+    Scores mutual information of each feature and target like mutual_info_classif, but
+    ranges of columns are scored in parallel worker processes.
+
+    :param X: feature matrix
+    :param y: target labels
+    :param processes: amount of cores to use, None uses all available cores
+    """
+    n_processes, _ = budget_processes(X.shape[1], processes)
+    chunk_size = math.ceil(X.shape[1] / (n_processes * 4))
+    chunks = [(i, min(i + chunk_size, X.shape[1])) for i in range(0, X.shape[1], chunk_size)]
+
+    # Columns are sliced from CSC matrix without copying the whole matrix
+    if sparse.issparse(X):
+        X = X.tocsc()
+
+    with Pool(n_processes, initializer=init_comparison_worker, initargs=((X, y),)) as p:
+        scores = p.map(score_columns, chunks)
+
+    return np.concatenate(scores)
+
+
+def create_metrics(path='metrics/accuracies.csv'):
+    """
+    Creates an empty metrics file with a header row.
+
+    :param path: path of the metrics file
+    """
+    with open(path, 'w') as f:
+        f.write(','.join(METRICS_COLUMNS) + '\n')
+
+
+def save_metrics(rows, path='metrics/accuracies.csv'):
+    """
+    Appends metrics of models to metrics file. Metrics that were not measured are left empty.
+
+    :param rows: metrics of models returned by test_model or run_models
+    :param path: path of the metrics file
+    """
+    with open(path, 'a') as f:
+        for row in rows:
+            f.write(','.join(str(row.get(x, '')) for x in METRICS_COLUMNS) + '\n')
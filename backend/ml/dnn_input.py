@@ -0,0 +1,122 @@
+import numpy as np
+import tensorflow as tf
+
+from ml_conf import *
+from ml_utils import AUGMENT_MIN_FEATURES, AUGMENT_MIN_FEATURE_TYPE_COUNT, MAX_AUGMENT
+
+
+def augment_mask(items, labels):
+    """
+    Returns a boolean array that tells which items are augmented while training. Items of
+    class 0 are augmented like in load_data_classification.
+
+    :param items: Item-class objects
+    :param labels: labels of the items
+    """
+    return np.array([label == 0 and item.get_feature_count() > AUGMENT_MIN_FEATURES
+                     for item, label in zip(items, labels)], dtype=bool)
+
+
+def epoch_size(X, augment=None):
+    """
+    Returns the amount of items fed to the model in one epoch including augmented versions.
+
+    :param X: encoded inputs returned by encode_items
+    :param augment: boolean array of items augmented on the fly
+    """
+    if augment is None:
+        return len(X[0])
+
+    counts = np.stack([np.count_nonzero(x, axis=1) for x in X], axis=1)
+    candidates = np.where(counts > AUGMENT_MIN_FEATURE_TYPE_COUNT, counts, 0).sum(axis=1)
+    return len(X[0]) + int(np.minimum(candidates, MAX_AUGMENT)[augment].sum())
+
+
+def drop_feature(features, positions, lengths):
+    """
+    Drops one token from encoded inputs of each item and moves rest of the tokens of the same
+    input left, which is the same as removing the feature from the item before encoding.
+    Items with a negative position are returned unchanged.
+
+    :param features: encoded inputs of a batch of items
+    :param positions: position of the dropped token of each item in the concatenated inputs
+    :param lengths: lengths of the inputs
+    """
+    dropped = []
+    start = 0
+
+    for x, length in zip(features, lengths):
+        local = positions[:, tf.newaxis] - start
+        idxs = tf.range(length)[tf.newaxis, :]
+        shift = tf.cast((idxs >= local) & (local >= 0) & (local < length), tf.int32)
+        padded = tf.pad(x, [[0, 0], [0, 1]])
+        dropped.append(tf.gather(padded, idxs + shift, batch_dims=1))
+        start += length
+
+    return tuple(dropped)
+
+
+def augment_batch(features, labels, augment, lengths):
+    """
+    Adds augmented versions of items to a batch. Up to MAX_AUGMENT versions of each item are
+    made by dropping a random feature from feature types that have more than
+    AUGMENT_MIN_FEATURE_TYPE_COUNT features. New versions are sampled on every epoch.
+
+    :param features: encoded inputs of a batch of items
+    :param labels: labels of the items
+    :param augment: tells which items are augmented
+    :param lengths: lengths of the inputs
+    """
+    tokens = tf.concat(features, axis=1)
+    droppable = tf.concat([tf.repeat(tf.math.count_nonzero(x, axis=1, keepdims=True) > AUGMENT_MIN_FEATURE_TYPE_COUNT,
+                                     length, axis=1) for x, length in zip(features, lengths)], axis=1)
+    candidates = (tokens != 0) & droppable & augment[:, tf.newaxis]
+
+    # Random positions are sampled without replacement by taking the largest random scores
+    scores = tf.where(candidates, tf.random.uniform(tf.shape(tokens)), -1.0)
+    k = min(MAX_AUGMENT, tokens.shape[1])
+    top_scores, positions = tf.math.top_k(scores, k=k)
+
+    versions = [features] + [drop_feature(features, positions[:, i], lengths) for i in range(k)]
+    used = tf.concat([tf.ones_like(top_scores[:, :1], dtype=tf.bool), top_scores >= 0], axis=1)
+
+    # Versions of an item are kept next to each other
+    stacked = tuple(tf.reshape(tf.stack(x, axis=1), [-1, length]) for x, length in zip(zip(*versions), lengths))
+    used = tf.reshape(used, [-1])
+    labels = tf.repeat(labels, k + 1)
+
+    return tuple(tf.boolean_mask(x, used) for x in stacked), tf.boolean_mask(labels, used)
+
+
+def make_dataset(X, y, augment=None, shuffle=False, batch_size=BATCH_SIZE):
+    """
+    Builds a tf.data pipeline that feeds encoded items to the DNN model in batches. Batches
+    are prepared in the background while the model is trained.
+
+    :param X: encoded inputs returned by encode_items
+    :param y: labels of the items
+    :param augment: boolean array of items augmented on the fly, None disables augmentation
+    :param shuffle: determines if items are reshuffled on every epoch
+    :param batch_size: amount of items in a batch
+    """
+    lengths = [x.shape[1] for x in X]
+
+    if augment is None or not augment.any():
+        dataset = tf.data.Dataset.from_tensor_slices((tuple(X), y))
+
+        if shuffle:
+            dataset = dataset.shuffle(len(y), reshuffle_each_iteration=True)
+
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    dataset = tf.data.Dataset.from_tensor_slices((tuple(X), y, augment))
+
+    if shuffle:
+        dataset = dataset.shuffle(len(y), reshuffle_each_iteration=True)
+
+    # Items are augmented in batches and augmented versions are batched again
+    dataset = dataset.batch(batch_size).map(
+        lambda features, labels, augment: augment_batch(features, labels, augment, lengths),
+        num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset.rebatch(batch_size).prefetch(tf.data.AUTOTUNE)
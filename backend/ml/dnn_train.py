@@ -7,7 +7,9 @@ import time
 import numpy as np
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+from tensorflow.keras.callbacks import EarlyStopping
 from tensorflow.keras.optimizers import *
+from tensorflow.keras.optimizers.schedules import ExponentialDecay
 from tensorflow.keras import layers, Model
 from tensorflow.keras.preprocessing.text import Tokenizer
 from sklearn.model_selection import train_test_split
@@ -16,6 +18,8 @@ from sklearn import metrics
 from ml_conf import *
 from ml_utils import *
 from ml_models import *
+from feature_encoder import encode_items
+from dnn_input import augment_mask, epoch_size, make_dataset
 
 TERMINAL_SIZE = os.get_terminal_size()[0]
 
@@ -30,8 +34,9 @@ if __name__ == "__main__":
     if not os.path.exists('models'):
         os.makedirs('models')
 
-    X_train, y_train = load_data_classification(PREPROCESS_FILE_PATH['training'], augment=True)
-    X_valid, y_valid = load_data_classification(PREPROCESS_FILE_PATH['validating'], augment=True)
+    # Class 0 is augmented on the fly while training
+    X_train, y_train = load_data_classification(PREPROCESS_FILE_PATH['training'])
+    X_valid, y_valid = load_data_classification(PREPROCESS_FILE_PATH['validating'])
     X_test, y_test = load_data_classification(PREPROCESS_FILE_PATH['testing'])
 
     X_train = X_train + X_valid
@@ -125,36 +130,32 @@ if __name__ == "__main__":
     }
     pickle.dump(field_lengths, open('models/field_lengths.pkl', 'wb'))
 
-    def prepare_data(X):
-        X1, X2, X3, X4, X5 = [[] for x in range(5)]
-
-        # Update item features to encoded versions, pad in same iteration
-        for item in X:
-            data_authors = author_tokenizer.texts_to_sequences([item.get_feature('authors')])[0]
-            data_authors = pad_sequence(data_authors, authors_max_len)
-            X1.append(data_authors)
-
-            data_genres = genres_tokenizer.texts_to_sequences([item.get_feature('genres')])[0]
-            data_genres = pad_sequence(data_genres, genres_max_len)
-            X2.append(data_genres)
-
-            data_series = series_tokenizer.texts_to_sequences([item.get_feature('series')])[0]
-            data_series = pad_sequence(data_series, series_max_len)
-            X3.append(data_series)
-
-            data_subjects = subjects_tokenizer.texts_to_sequences([item.get_feature('subjects')])[0]
-            data_subjects = pad_sequence(data_subjects, subjects_max_len)
-            X4.append(data_subjects)
-
-            data_publishers = publishers_tokenizer.texts_to_sequences([item.get_feature('publishers')])[0]
-            data_publishers = pad_sequence(data_publishers, publishers_max_len)
-            X5.append(data_publishers)
+    tokenizers = {
+        'author': author_tokenizer,
+        'genres': genres_tokenizer,
+        'series': series_tokenizer,
+        'subjects': subjects_tokenizer,
+        'publisher': publishers_tokenizer
+    }
 
-        return [np.array(X1), np.array(X2), np.array(X3), np.array(X4), np.array(X5)]
+    def prepare_data(X):
+        return encode_items(X, tokenizers, field_lengths)
 
+    augment = augment_mask(X_train, y_train)
     X_train = prepare_data(X_train)
     X_test = prepare_data(X_test)
 
+    # Part of training set is held out for early stopping
+    idx_fit, idx_holdout = train_test_split(
+        np.arange(len(y_train)), test_size=HOLDOUT_SPLIT, stratify=y_train, random_state=0)
+    X_fit = [x[idx_fit] for x in X_train]
+    fit_dataset = make_dataset(X_fit, y_train[idx_fit], augment=augment[idx_fit], shuffle=True)
+    holdout_dataset = make_dataset([x[idx_holdout] for x in X_train], y_train[idx_holdout])
+    test_dataset = make_dataset(X_test, y_test)
+    print(f'Holding out {len(idx_holdout)} items of training set for early stopping')
+    print(f'Augmenting {augment[idx_fit].sum()} items of class 0 while training')
+    steps_per_epoch = int(np.ceil(epoch_size(X_fit, augment[idx_fit]) / BATCH_SIZE))
+
     model = build_ee_dnn(
         authors_max_len,
         author_vocab_size,
@@ -168,17 +169,22 @@ if __name__ == "__main__":
         publishers_vocab_size,
         num_classes)
 
-    optimizer = Nadam(learning_rate=0.000001)
+    learning_rate = ExponentialDecay(
+        LEARNING_RATE, decay_steps=steps_per_epoch, decay_rate=LEARNING_RATE_DECAY)
+    optimizer = Nadam(learning_rate=learning_rate)
     model.compile(loss='sparse_categorical_crossentropy',
                   optimizer=optimizer, metrics=['accuracy'])
 
     print('\n' + '*' * TERMINAL_SIZE)
     print('TRAINING WITH TRAINING SET')
-    history = model.fit(X_train, y_train, epochs=EPOCHS, verbose=1, batch_size=8)
+    early_stopping = EarlyStopping(
+        monitor='val_loss', patience=EARLY_STOPPING_PATIENCE, restore_best_weights=True)
+    history = model.fit(fit_dataset, validation_data=holdout_dataset,
+                        epochs=EPOCHS, callbacks=[early_stopping], verbose=1)
 
     print('\n' + '*' * TERMINAL_SIZE)
     print('VALIDATING MODEL WITH VALIDATION SET')
-    loss = model.evaluate(X_test, y_test)
+    loss = model.evaluate(test_dataset)
 
     model.save('models/dnn')
     print('\nDNN MODEL HAS BEEN TRAINED AND SAVED\n')
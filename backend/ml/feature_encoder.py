@@ -0,0 +1,130 @@
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+# Inputs of the DNN model in order as (item attribute, tokenizer name)
+DNN_FEATURES = [
+    ('authors', 'author'),
+    ('genres', 'genres'),
+    ('series', 'series'),
+    ('subjects', 'subjects'),
+    ('publishers', 'publisher')
+]
+
+# Characters that separate features in feature strings in addition to '#'
+FEATURE_FILTERS = '!"$%&()*+./:;<=>?@[\\]^`{|}~\n'
+
+
+class FeatureTokenizer:
+    """
+    Vocabulary of features in feature strings of items. Gives the same word_index and
+    sequences as Keras Tokenizer(lower=False, split='#', filters=FEATURE_FILTERS), but does
+    not import Tensorflow, so processes can be forked after using it.
+    """
+
+    def __init__(self, filters=FEATURE_FILTERS):
+        self.translate_map = str.maketrans({x: '#' for x in filters})
+        self.word_index = {}
+
+    def split(self, text):
+        """
+        Splits a feature string into features.
+
+        :param text: feature string of an item
+        """
+        return [x for x in text.translate(self.translate_map).split('#') if x]
+
+    def fit_on_texts(self, texts):
+        """
+        Builds the vocabulary. Features are indexed from 1 in descending order of frequency,
+        features with equal frequency in order of first appearance.
+
+        :param texts: feature strings of items
+        """
+        counts = Counter()
+        for text in texts:
+            counts.update(self.split(text))
+
+        self.word_index = {x: i for i, (x, _) in enumerate(counts.most_common(), 1)}
+
+    def texts_to_sequences(self, texts):
+        """
+        Returns ids of features of each feature string. Features missing from the vocabulary
+        are skipped.
+
+        :param texts: feature strings of items
+        """
+        word_index = self.word_index
+        return [[word_index[x] for x in self.split(text) if x in word_index] for text in texts]
+
+
+def encode_feature(items, feature, tokenizer, maxlen):
+    """
+    Encodes a feature of items into a zero padded matrix of token ids. Works like
+    texts_to_sequences of the tokenizer: features missing from vocabulary of the
+    tokenizer are skipped. Sequences longer than maxlen are truncated from the end.
+
+    :param items: Item-class objects to encode
+    :param feature: name of the feature (e.g. authors)
+    :param tokenizer: tokenizer fitted for the feature
+    :param maxlen: length sequences will be padded or truncated to
+    """
+    word_index = tokenizer.word_index
+    token_ids = []
+    lengths = np.zeros(len(items), dtype=np.int64)
+
+    for i, item in enumerate(items):
+        ids = item.get_token_ids(feature, word_index)
+        token_ids.extend(ids)
+        lengths[i] = len(ids)
+
+    encoded = np.zeros((len(items), maxlen), dtype=np.int32)
+
+    if len(token_ids) == 0 or maxlen == 0:
+        return encoded
+
+    # Position of each token within its own sequence
+    rows = np.repeat(np.arange(len(items)), lengths)
+    cols = np.arange(len(token_ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    fits = cols < maxlen
+
+    encoded[rows[fits], cols[fits]] = np.array(token_ids, dtype=np.int32)[fits]
+    return encoded
+
+
+def encode_items(items, tokenizers, field_lengths):
+    """
+    Encodes items into the five input matrices of the DNN model.
+
+    :param items: Item-class objects to encode
+    :param tokenizers: dictionary of tokenizers keyed by tokenizer name
+    :param field_lengths: dictionary of input lengths keyed by item attribute
+    """
+    return [encode_feature(items, feature, tokenizers[tokenizer], field_lengths[feature])
+            for feature, tokenizer in DNN_FEATURES]
+
+
+def encode_onehot(items, tokenizer):
+    """
+    Encodes all features of items into a sparse CSR matrix of one-hot rows. Rows are the same
+    as texts_to_matrix of the tokenizer returns for feature strings of the items, but only the
+    features of each item are stored.
+
+    :param items: Item-class objects to encode
+    :param tokenizer: tokenizer fitted for feature strings of items
+    """
+    sequences = tokenizer.texts_to_sequences(x.get_feature_string() for x in items)
+    lengths = [len(x) for x in sequences]
+
+    indptr = np.zeros(len(sequences) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(lengths)
+    indices = np.fromiter((x for sequence in sequences for x in sequence), dtype=np.int32, count=indptr[-1])
+
+    encoded = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                                shape=(len(sequences), len(tokenizer.word_index) + 1))
+
+    # Features repeated in an item are marked only once
+    encoded.sum_duplicates()
+    encoded.data[:] = 1
+    return encoded
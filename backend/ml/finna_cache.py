@@ -0,0 +1,170 @@
+import gzip
+import json
+import os
+import zlib
+
+from ml_conf import *
+
+# Records compressed together in one gzip member of a compressed cache
+FINNA_CACHE_BLOCK_SIZE = 64
+
+
+def is_compressed(path):
+    """
+    Returns True if cache file in given path is gzip compressed.
+
+    :param path: path of the cache file
+    """
+    return path.endswith('.gz')
+
+
+def iter_finna_records(path=FINNA_FILE_PATH):
+    """
+    Streams records from a cache file one record at a time.
+
+    :param path: path of the cache file
+    """
+    opener = gzip.open if is_compressed(path) else open
+
+    with opener(path, 'rt', encoding='utf-8') as fin:
+        for line in fin:
+            yield json.loads(line)
+
+
+def write_finna_cache(records, path=FINNA_FILE_PATH, index_path=FINNA_INDEX_FILE_PATH):
+    """
+    Writes records as line-delimited JSON and a sidecar index of byte offsets of records.
+    Compressed caches are written as independent gzip members of FINNA_CACHE_BLOCK_SIZE records
+    so a single record can be read by decompressing only its own block. Each index entry is
+    [block offset, block length, record offset in block, record length]. Records with an id that
+    has already been written are skipped. Returns the amount of records written.
+
+    :param records: iterable of records retrieved from Finna
+    :param path: path of the cache file
+    :param index_path: path of the index file
+    """
+    compressed = is_compressed(path)
+    index = {}
+    block = []
+    block_ids = []
+
+    with open(f'{path}.tmp', 'wb') as fout:
+
+        def write_block():
+            offset = fout.tell()
+            data = b''.join(block)
+            fout.write(gzip.compress(data) if compressed else data)
+            length = fout.tell() - offset
+            record_offset = 0
+
+            for record_id, line in zip(block_ids, block):
+                index[record_id] = [offset, length, record_offset, len(line)]
+                record_offset += len(line)
+
+            block.clear()
+            block_ids.clear()
+
+        for record in records:
+            if record['id'] in index or record['id'] in block_ids:
+                continue
+
+            block.append(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+            block_ids.append(record['id'])
+
+            # Uncompressed records are indexed one by one
+            if not compressed or len(block) == FINNA_CACHE_BLOCK_SIZE:
+                write_block()
+
+        if len(block) > 0:
+            write_block()
+
+    with open(f'{index_path}.tmp', 'w') as fout:
+        json.dump(index, fout)
+
+    os.replace(f'{path}.tmp', path)
+    os.replace(f'{index_path}.tmp', index_path)
+    return len(index)
+
+
+def convert_finna_json(json_path, path=FINNA_FILE_PATH, index_path=FINNA_INDEX_FILE_PATH):
+    """
+    Converts Finna data saved as a single JSON document by earlier versions to the cache format.
+
+    :param json_path: path of the JSON file
+    :param path: path of the cache file
+    :param index_path: path of the index file
+    """
+    with open(json_path, 'r') as fin:
+        records = json.load(fin)['records']
+
+    return write_finna_cache(records, path, index_path)
+
+
+class FinnaCache:
+    """
+    Read-only access to records of a cache file by Finna id. Only the index is held in memory,
+    records are read from disk on request. Reads use positional reads so the same object can be
+    shared with forked worker processes.
+    """
+
+    def __init__(self, path=FINNA_FILE_PATH, index_path=FINNA_INDEX_FILE_PATH):
+        self.path = path
+        self.compressed = is_compressed(path)
+
+        with open(index_path, 'r') as fin:
+            self.index = json.load(fin)
+
+        self.fd = None
+        self.pid = None
+        self.block_offset = None
+        self.block = None
+
+    def read_block(self, offset, length):
+        """
+        Reads and decompresses one block of the cache file. The last block read is kept in memory
+        because records of the same block are often read one after another.
+
+        :param offset: byte offset of the block
+        :param length: length of the block in bytes
+        """
+        # File descriptor is opened again in forked processes
+        if self.fd is None or self.pid != os.getpid():
+            self.fd = os.open(self.path, os.O_RDONLY)
+            self.pid = os.getpid()
+
+        if self.block_offset != offset:
+            data = os.pread(self.fd, length, offset)
+            self.block = zlib.decompress(data, wbits=31) if self.compressed else data
+            self.block_offset = offset
+
+        return self.block
+
+    def get(self, finna_id, default=None):
+        """
+        Returns record of given Finna id or default if the record is not in cache.
+
+        :param finna_id: Finna id of the record
+        :param default: value returned if record is not found
+        """
+        entry = self.index.get(finna_id)
+
+        if entry is None:
+            return default
+
+        block_offset, block_length, record_offset, record_length = entry
+        block = self.read_block(block_offset, block_length)
+        return json.loads(block[record_offset:record_offset + record_length])
+
+    def __contains__(self, finna_id):
+        return finna_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter_finna_records(self.path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update({'fd': None, 'pid': None, 'block_offset': None, 'block': None})
+        return state
@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+from ml_conf import *
+
+# Fields requested for each record
+FINNA_FIELDS = [
+    'classifications', 'container', 'genres', 'id', 'newerTitles', 'previousTitles', 'nonPresenterAuthors',
+    'rating', 'series', 'shortTitle', 'subjectsExtended', 'publishers', 'summary', 'year'
+]
+
+# Records retrieved in one request per Finna administration recommendation
+FINNA_BATCH_SIZE = 100
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the rate of requests. Tokens are refilled
+    continuously with the given rate up to the capacity of the bucket.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token from the bucket, waits until a token is available if the bucket is empty.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min([self.capacity, self.tokens + (now - self.updated) * self.rate])
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class FinnaHarvester:
+    """
+    Fetches records from Finna API with concurrent requests over a pooled HTTP session.
+    Fetched batches are checkpointed to disk as line-delimited JSON so an interrupted
+    harvest can be resumed without fetching the same records again.
+    """
+
+    def __init__(self, library, base_url=FINNA_API_URL, requests_per_second=FINNA_REQUESTS_PER_SECOND,
+                 concurrent_requests=FINNA_CONCURRENT_REQUESTS, max_retries=FINNA_MAX_RETRIES,
+                 retry_backoff=FINNA_RETRY_BACKOFF, checkpoint_path=FINNA_CHECKPOINT_FILE_PATH):
+        self.library = library
+        self.base_url = base_url
+        self.concurrent_requests = concurrent_requests
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.checkpoint_path = checkpoint_path
+        self.bucket = TokenBucket(requests_per_second)
+
+        self.session = requests.Session()
+        self.session.headers.update({'from': CONTACT_EMAIL})
+        self.session.mount(self.base_url, HTTPAdapter(pool_maxsize=concurrent_requests))
+
+    def build_params(self, ids):
+        """
+        Builds query parameters of a request for given bib ids.
+
+        :param ids: bib ids to fetch
+        """
+        params = [('id[]', f'{self.library}.{x}') for x in ids]
+        params.extend([('field[]', x) for x in FINNA_FIELDS])
+        params.append(('lng', 'fi'))
+        return params
+
+    def fetch_batch(self, ids):
+        """
+        Fetches one batch of records. Requests that fail because of connection errors,
+        invalid responses, rate limiting or server errors are retried with exponential backoff.
+        Returns records and url of the request if it failed, otherwise None.
+
+        :param ids: bib ids to fetch
+        """
+        params = self.build_params(ids)
+        url = requests.Request('GET', self.base_url, params=params).prepare().url
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+
+            try:
+                res = self.session.get(self.base_url, params=params, timeout=60)
+            except requests.RequestException:
+                res = None
+
+            if res is not None and res.status_code == 200:
+                # Truncated or non-JSON bodies, e.g. error pages of a proxy, are retried
+                try:
+                    return res.json().get('records', []), None
+                except ValueError:
+                    res = None
+
+            # Other client errors will not succeed by retrying
+            if res is not None and res.status_code != 429 and res.status_code < 500:
+                return [], url
+
+            if attempt < self.max_retries:
+                retry_after = res.headers.get('Retry-After') if res is not None else None
+                time.sleep(float(retry_after) if retry_after and retry_after.isdigit()
+                           else self.retry_backoff * 2 ** attempt)
+
+        return [], url
+
+    def iter_checkpoint(self):
+        """
+        Streams batches fetched earlier from the checkpoint file. A line left incomplete
+        by an interrupted write is removed.
+        """
+        if not os.path.isfile(self.checkpoint_path):
+            return
+
+        with open(self.checkpoint_path, 'rb+') as fin:
+            fin.seek(0, os.SEEK_END)
+            if fin.tell() > 0:
+                fin.seek(-1, os.SEEK_END)
+                if fin.read(1) != b'\n':
+                    fin.seek(0)
+                    fin.truncate(fin.read().rfind(b'\n') + 1)
+
+        with open(self.checkpoint_path, 'r') as fin:
+            for line in fin:
+                yield json.loads(line)
+
+    def records(self):
+        """
+        Streams records fetched so far from the checkpoint file.
+        """
+        for batch in self.iter_checkpoint():
+            yield from batch['records']
+
+    def harvest(self, ids):
+        """
+        Fetches records of given bib ids, resuming from the checkpoint file if it exists.
+        Fetched records are only written to the checkpoint file and can be read with records().
+        Returns urls of requests that failed. Failed batches are not checkpointed so they are
+        retried when the harvest is run again.
+
+        :param ids: bib ids to fetch
+        """
+        fetched_ids = set()
+        for batch in self.iter_checkpoint():
+            fetched_ids.update(batch['ids'])
+
+        unfetched = [x for x in ids if x not in fetched_ids]
+        batches = [unfetched[i:i + FINNA_BATCH_SIZE] for i in range(0, len(unfetched), FINNA_BATCH_SIZE)]
+        error_urls = []
+
+        if len(fetched_ids) > 0:
+            print(f'Resuming from checkpoint with {len(fetched_ids)} bib ids already fetched')
+
+        print(f'{len(batches)} API calls until all data is fetched')
+
+        with ThreadPoolExecutor(max_workers=self.concurrent_requests) as executor, \
+                open(self.checkpoint_path, 'a') as checkpoint:
+            futures = {executor.submit(self.fetch_batch, x): x for x in batches}
+
+            for n, future in enumerate(as_completed(futures), 1):
+                batch_records, error_url = future.result()
+
+                if error_url is not None:
+                    error_urls.append(error_url)
+                else:
+                    # Batches are written by the main thread only
+                    checkpoint.write(json.dumps({'ids': futures[future], 'records': batch_records}) + '\n')
+                    checkpoint.flush()
+
+                if n % 10 == 0 or n == len(batches):
+                    print(f'{n}/{len(batches)} API calls done, {len(error_urls)} failed')
+
+        return error_urls
@@ -0,0 +1,172 @@
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.append('..')
+from backend.classes.item import Item
+
+# Features of items that are lists of strings
+LIST_FEATURES = ['authors', 'publishers', 'series', 'genres', 'subjects']
+
+# Features of items that are dates, missing dates are stored as NaT
+DATE_FEATURES = ['acquired', 'deleted', 'last_borrowed']
+
+# Features of items that are integers, missing values are marked in a separate mask
+INT_FEATURES = ['bib_id', 'item_id', 'pubyear']
+
+
+def encode_strings(strings):
+    """
+    Encodes strings to a single UTF-8 buffer. Returns the buffer and offsets of strings in it.
+
+    :param strings: strings to encode
+    """
+    encoded = [x.encode('utf-8') for x in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in encoded])
+
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(buffer, offsets):
+    """
+    Decodes strings encoded with encode_strings.
+
+    :param buffer: UTF-8 buffer of strings
+    :param offsets: offsets of strings in the buffer
+    """
+    data = buffer.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def ragged_indptr(lengths):
+    """
+    Returns offsets of rows of a ragged array given lengths of the rows.
+
+    :param lengths: lengths of rows
+    """
+    indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(lengths)
+    return indptr
+
+
+def save_items(items, path):
+    """
+    Saves items to a compact .npz dataset. Each list feature is stored with a vocabulary of its
+    distinct values and item rows of vocabulary indexes in CSR form. Circulation sequences are
+    stored as one ragged int16 array.
+
+    :param items: Item-class objects to save
+    :param path: path of the dataset file
+    """
+    arrays = {}
+
+    for feature in LIST_FEATURES:
+        vocabulary = {}
+        indices = [vocabulary.setdefault(x, len(vocabulary)) for item in items for x in item[feature]]
+
+        arrays[f'{feature}_vocabulary'], arrays[f'{feature}_vocabulary_offsets'] = encode_strings(vocabulary)
+        arrays[f'{feature}_indices'] = np.array(indices, dtype=np.int32)
+        arrays[f'{feature}_indptr'] = ragged_indptr([len(item[feature]) for item in items])
+
+    arrays['title_missing'] = np.array([not isinstance(item.title, str) for item in items], dtype=bool)
+    arrays['title'], arrays['title_offsets'] = encode_strings(
+        [item.title if isinstance(item.title, str) else '' for item in items])
+
+    for feature in INT_FEATURES:
+        arrays[f'{feature}_missing'] = np.array([item[feature] is None for item in items], dtype=bool)
+        arrays[feature] = np.array([item[feature] if item[feature] is not None else 0 for item in items],
+                                   dtype=np.int64)
+
+    for feature in DATE_FEATURES:
+        arrays[feature] = np.array([item[feature] if item[feature] is not None else 'NaT' for item in items],
+                                   dtype='datetime64[us]')
+
+    sequences = [np.asarray(item.circulation_sequence if item.circulation_sequence is not None else [],
+                            dtype=np.int64) for item in items]
+    circulation = np.concatenate(sequences) if len(sequences) > 0 else np.zeros(0, dtype=np.int64)
+
+    if circulation.size > 0 and (circulation.min() < np.iinfo(np.int16).min or circulation.max() > np.iinfo(np.int16).max):
+        raise ValueError('Circulation sequence has values that do not fit to 16 bits')
+
+    arrays['circulation'] = circulation.astype(np.int16)
+    arrays['circulation_indptr'] = ragged_indptr([len(x) for x in sequences])
+
+    with open(f'{path}.tmp', 'wb') as fout:
+        np.savez(fout, **arrays)
+    os.replace(f'{path}.tmp', path)
+
+
+class ItemDataset:
+    """
+    Items saved with save_items. All arrays are read when the dataset is opened, Item-class
+    objects are built from them only when items are accessed.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            arrays = {x: data[x] for x in data.files}
+
+        self.vocabularies = {x: decode_strings(arrays[f'{x}_vocabulary'], arrays[f'{x}_vocabulary_offsets'])
+                             for x in LIST_FEATURES}
+        self.indices = {x: arrays[f'{x}_indices'] for x in LIST_FEATURES}
+        self.indptrs = {x: arrays[f'{x}_indptr'] for x in LIST_FEATURES}
+
+        self.titles = arrays['title'].tobytes()
+        self.title_offsets = arrays['title_offsets']
+        self.title_missing = arrays['title_missing']
+
+        self.ints = {x: arrays[x] for x in INT_FEATURES}
+        self.int_missing = {x: arrays[f'{x}_missing'] for x in INT_FEATURES}
+        self.dates = {x: arrays[x] for x in DATE_FEATURES}
+
+        self.circulation = arrays['circulation']
+        self.circulation_indptr = arrays['circulation_indptr']
+
+    def __len__(self):
+        return len(self.title_missing)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+
+        if i < 0 or i >= len(self):
+            raise IndexError('Item index out of range')
+
+        features = {}
+
+        for feature in LIST_FEATURES:
+            indices = self.indices[feature][self.indptrs[feature][i]:self.indptrs[feature][i + 1]]
+            features[feature] = [self.vocabularies[feature][x] for x in indices]
+
+        for feature in INT_FEATURES:
+            features[feature] = int(self.ints[feature][i]) if not self.int_missing[feature][i] else None
+
+        for feature in DATE_FEATURES:
+            features[feature] = self.dates[feature][i].item()
+
+        if not self.title_missing[i]:
+            features['title'] = self.titles[self.title_offsets[i]:self.title_offsets[i + 1]].decode('utf-8')
+
+        item = Item(**features)
+        item.set_circulation_sequence(self.circulation[self.circulation_indptr[i]:self.circulation_indptr[i + 1]])
+        return item
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def load_items(filepath):
+    """
+    Opens items saved during preprocessing. Lists of items pickled by earlier versions
+    can still be loaded.
+
+    :param filepath: path of the dataset file
+    """
+    if filepath.endswith('.pkl'):
+        return pickle.load(open(filepath, 'rb'))
+
+    return ItemDataset(filepath)
@@ -1,3 +1,5 @@
+import time
+
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sn
@@ -33,7 +35,8 @@ def save_confusion_matrix(cf, name):
 
 def test_model(model, X_test, y_test, name):
     """
-    Tests model and saves report of test as confusion matrix.
+    Tests model and saves report of test as confusion matrix. Returns metrics of the test
+    as a dictionary that can be saved to metrics file.
 
     :param model: ML model to be tested
     :param X_test: test data
@@ -41,15 +44,18 @@ def test_model(model, X_test, y_test, name):
     :param name: name of ML model
     """
     name = name.lower().replace(' ', '_')
+    start = time.perf_counter()
 
     if 'lightgbm' in name:
         y_pred = model.predict(X_test, num_iteration=model.best_iteration)
+        predict_seconds = time.perf_counter() - start
         plt.hist(y_pred, 20)
         plt.savefig('metrics/lightgbm_histogram.png')
         plt.clf()
         y_pred = y_pred.round(0).astype(int)
     else:
         y_pred = model.predict(X_test)
+        predict_seconds = time.perf_counter() - start
 
     if name == 'dnn_entity_embeddings':
         y_pred = np.argmax(y_pred, axis=1)
@@ -61,5 +67,8 @@ def test_model(model, X_test, y_test, name):
     print(f'Confusion matrix: {confusion_matrix}')
     save_confusion_matrix(confusion_matrix, name)
 
-    with open('metrics/accuracies.csv', 'a') as f:
-        f.write(f'{name},{round(accuracy * 100, 2)}\n')
+    return {
+        'name': name,
+        'accuracy': round(accuracy * 100, 2),
+        'predict_ms_per_item': round(predict_seconds * 1000 / len(y_test), 4)
+    }
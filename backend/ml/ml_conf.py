@@ -4,15 +4,29 @@
 ITEM_INFO_FILE_PATH = 'data/items.csv'
 CIRCULATION_FILE_PATH = 'data/circulation.csv'
 
+# Location of data files for incremental database update (same format as above).
+# Update file of items contains only new and deleted items and update file of circulation
+# contains circulation log starting from the month after the database was last updated.
+UPDATE_ITEM_INFO_FILE_PATH = 'data/items_update.csv'
+UPDATE_CIRCULATION_FILE_PATH = 'data/circulation_update.csv'
+
+# Parsed source files are cached here in Feather format if pyarrow is installed
+INPUT_CACHE_FOLDER = 'data/cache'
+
 # Locations to save data during processing
+# Files ending with .pkl are read as pickled lists of items saved by earlier versions
 PREPROCESS_FILE_PATH = {
-    'training': 'data/preprocessed_training.pkl',
-    'validating': 'data/preprocessed_validating.pkl',
-    'testing': 'data/preprocessed_testing.pkl',
-    'db_constructing': 'data/preprocessed_visualization.pkl'
+    'training': 'data/preprocessed_training.npz',
+    'validating': 'data/preprocessed_validating.npz',
+    'testing': 'data/preprocessed_testing.npz',
+    'db_constructing': 'data/preprocessed_visualization.npz'
 }
 MODEL_SAVE_FOLDER = 'models'
 
+# Circulation of database items exported for memory-mapping
+CIRCULATION_MATRIX_FILE_PATH = 'data/circulation_matrix.npy'
+CIRCULATION_INDEX_FILE_PATH = 'data/circulation_index.npy'
+
 # DATA SPLIT
 # Try to aim for (80/10/10) split for your data. Even if you don't plan to do
 # development, take care that every split is valid as all of them affect the
@@ -72,13 +86,32 @@ MIN_FEATURES = 5
 MONTHS_TO_AVG = 12
 CIRCULATION_CLASSIFICATION_BREAKPOINT = 4/12
 
+# PREPROCESSING
+# Items are preprocessed in chunks of rows by a pool of processes.
+# None uses all available cores.
+PREPROCESS_PROCESSES = None
+PREPROCESS_CHUNK_SIZE = 2000
+
+# MODEL COMPARISON
+# Cores used to fit compared models in parallel and to score features.
+# None uses all available cores.
+COMPARISON_PROCESSES = None
+
 # FINNA
 # If you are using Finna you should check these parameters
 # If you are not using Finna, just turn USE_FINNA to False
 USE_FINNA = True
 FORCE_FETCH = False
-FINNA_FILE_PATH = 'data/finna_data.json'
+FINNA_FILE_PATH = 'data/finna_data.jsonl.gz'  # Cache is compressed if the path ends with .gz
+FINNA_INDEX_FILE_PATH = 'data/finna_data_index.json'
+FINNA_LEGACY_FILE_PATH = 'data/finna_data.json'  # Single JSON document saved by earlier versions
+FINNA_CHECKPOINT_FILE_PATH = 'data/finna_checkpoint.jsonl'
 FINNA_LIBRARY_NAME = 'vaarakirjastot'
+FINNA_API_URL = 'https://api.finna.fi/api/v1/record'
+FINNA_REQUESTS_PER_SECOND = 1
+FINNA_CONCURRENT_REQUESTS = 4
+FINNA_MAX_RETRIES = 5
+FINNA_RETRY_BACKOFF = 2
 SUBJECT_SOURCES = [
     'kaunokki', 'ysa', 'kauno7fin', 'kaunokki.', ' kauno/fin', 'yso/fin', 'yso', 'kaunokkki', 
     'kauno/fin', 'kaunu/fin', 'kauni/fin', 'ykauno/fin', 'kauno/fi', 'kaun/fin'
@@ -89,5 +122,9 @@ CONTACT_EMAIL = ''
 SEQUENCE_DELETED_SYMBOL = -1  # DO NOT CHANGE
 
 # ML hyperparameters
-EPOCHS = 30
+EPOCHS = 30  # Upper limit, training stops early when loss of holdout set stops improving
 LEARNING_RATE = 0.001
+LEARNING_RATE_DECAY = 0.9  # Learning rate is multiplied by this after every epoch
+BATCH_SIZE = 256
+EARLY_STOPPING_PATIENCE = 3  # Epochs without improvement before training is stopped
+HOLDOUT_SPLIT = 0.1  # Part of training data held out for early stopping
@@ -1,5 +1,3 @@
-import copy
-import pickle
 import random
 import sys
 
@@ -7,54 +5,53 @@ import numpy as np
 
 sys.path.append('..')
 from backend.classes.item import Item
+from backend.ml.item_dataset import load_items
 from backend.ml.ml_conf import *
 
+# Items of class 0 with more features than this are augmented
+AUGMENT_MIN_FEATURES = 10
+# Only feature types with more features than this are augmented
+AUGMENT_MIN_FEATURE_TYPE_COUNT = 3
+# Maximum amount of augmented versions of one item
+MAX_AUGMENT = 3
+
 
 def load_data_classification(filepath, augment=False, full_rs=False):
     """
     Loads data and processes it so that the label is one of two classes defined. 
     Breakpoint for circulation is defined in conf.py (default: 4 loans in first 12 months).
 
-    :param filepath: path to file which has serialized members of Item class
+    :param filepath: path to dataset file saved during preprocessing
     :param augment: determines if class 0 members should be augmented in case classes are imbalanced
     :param full_rs: changes label from class 0 to -1. Use if evaluating full rs using api/test_recommender.py
     """
 
-    tmp_items = []
-    tmp_bib_ids = []
-
-    items = pickle.load(open(filepath, 'rb'))
+    items = load_items(filepath)
 
     print(f'ITEM COUNT: {len(items)}')
 
-    for i in items:
-        if i.get_feature_count() < MIN_FEATURES:
-            continue
+    accepted = [i for i in items if i.get_feature_count() >= MIN_FEATURES and len(i.circulation_sequence) >= MONTHS_TO_AVG]
+    start_avg_circulation = np.mean(
+        np.array([i.circulation_sequence[:MONTHS_TO_AVG] for i in accepted], dtype=np.float64).reshape(-1, MONTHS_TO_AVG), axis=1)
 
-        sequence = i.circulation_sequence
-        if len(sequence) < MONTHS_TO_AVG:
-            continue
+    # Labeling, uses breakpoint defined in conf
+    labels = np.where(start_avg_circulation >= CIRCULATION_CLASSIFICATION_BREAKPOINT, 1, -1 if full_rs else 0)
 
-        tmp_x = {'info': i, 'label': 0}
-        start_avg_circulation = np.mean(sequence[:MONTHS_TO_AVG])
-
-        # Labeling, uses breakpoint defined in conf
-        if start_avg_circulation >= CIRCULATION_CLASSIFICATION_BREAKPOINT:
-            tmp_x['label'] = 1
+    tmp_items = []
+    bib_idxs = {}
 
-        if full_rs and tmp_x['label'] == 0:
-            tmp_x['label'] = -1
+    for i, label in zip(accepted, labels.tolist()):
+        bib_idx = bib_idxs.get(i.bib_id)
 
         # Design decision: for same bib, using the best label available through items
-        if i.bib_id in tmp_bib_ids:
-            bib_idx = tmp_bib_ids.index(i.bib_id)
-            if tmp_items[bib_idx]['label'] < tmp_x['label']:
-                tmp_items[bib_idx]['label'] = tmp_x['label']
+        if bib_idx is not None:
+            if tmp_items[bib_idx]['label'] < label:
+                tmp_items[bib_idx]['label'] = label
             if tmp_items[bib_idx]['info'].get_feature_count() < i.get_feature_count():
                 tmp_items[bib_idx]['info'] = i
         else:
-            tmp_items.append(tmp_x)
-            tmp_bib_ids.append(tmp_x['info'].bib_id)
+            bib_idxs[i.bib_id] = len(tmp_items)
+            tmp_items.append({'info': i, 'label': label})
 
     X, y = [], []
     n_augmented = 0
@@ -63,8 +60,8 @@ def load_data_classification(filepath, augment=False, full_rs=False):
 
     for i in tmp_items:
         if augment and i['label'] == 0:
-            if i['info'].get_feature_count() > 10:
-                augmented_items = augment_item(i, 3)
+            if i['info'].get_feature_count() > AUGMENT_MIN_FEATURES:
+                augmented_items = augment_item(i, MAX_AUGMENT)
                 for ai in augmented_items:
                     n_augmented += 1
                     X.append(ai['info'])
@@ -85,59 +82,36 @@ def load_data_classification(filepath, augment=False, full_rs=False):
     return X, np.array(y)
 
 
-def convert_features(x, tokenizer):
-    """
-    Converts features to one one-hot vectors using tokenizer.
-
-    :param x: sample belonging into the Item class
-    :param tokenizer: tokenizer used for feature transformation
-    """
-    return tokenizer.texts_to_matrix([x.get_feature_string()])[0]
-
-
-def pad_sequence(sequence, maxlen):
+def sample_feature_drops(item, max_augment):
     """
-    Pads sequence with zeros until its length is equal to max length.
+    Chooses which features are dropped from item when it is augmented. Only feature types
+    with more than three features are augmented. Returns pairs of feature type and index.
 
-    :param sequence: sequence to be padded in array form
-    :param maxlen: length sequence will be padded to
+    :param item: item to be augmented
+    :param max_augment: maximum number of augmented items
     """
-    if len(sequence) > maxlen:
-        sequence = sequence[:maxlen]
+    feature_counts = item.get_feature_counts()
+    drops = [(f, i) for f, count in feature_counts.items() if count > AUGMENT_MIN_FEATURE_TYPE_COUNT
+             for i in range(count)]
 
-    while len(sequence) < maxlen:
-        sequence.append(0)
+    if len(drops) > max_augment:
+        drops = random.sample(drops, max_augment)
 
-    return sequence
+    return drops
 
 
 def augment_item(item, max_augment):
     """
-    Creates new versions of item by deleting appropriate features one at a time.
+    Creates new versions of item by deleting appropriate features one at a time. Features to
+    delete are sampled first and only the sampled versions are created. New versions share
+    everything but the changed feature with the original item.
 
     :param item: item to be augmented
     :param max_augment: maximum number of augmented items to return
     """
-    augmented_items = []
-
     orig_item = item['info']
-    feature_counts = orig_item.get_feature_counts()
-    features_to_augment = dict(
-        filter(lambda x: x[1] > 3, feature_counts.items()))
-
-    for f in features_to_augment.keys():
-        for i in range(len(orig_item[f])):
-            new_item = copy.deepcopy(orig_item)
-            feature_to_delete = new_item[f][i]
-            new_item[f].remove(feature_to_delete)
-            augmented_items.append({'info': new_item, 'label': item['label']})
-
-    assert id(item['info']) != id(augmented_items[0]['info'])
-
-    if len(augmented_items) > max_augment:
-        augmented_sample = random.sample(augmented_items, max_augment)
-    else:
-        augmented_sample = augmented_items
+    augmented_sample = [{'info': orig_item.without_feature(f, i), 'label': item['label']}
+                        for f, i in sample_feature_drops(orig_item, max_augment)]
 
     augmented_sample.append(item)
     return augmented_sample
@@ -2,10 +2,9 @@ import os
 import pickle
 import sys
 
-from multiprocessing import Pool
-
+from finna_cache import convert_finna_json
 from ml_conf import *
-from preprocess_utils import finna_api_fetch, load_item_data, preprocess_items, process_phase
+from preprocess_utils import finna_api_fetch, load_finna_data, load_item_data, process_phases
 
 
 if __name__ == "__main__":
@@ -32,17 +31,24 @@ if __name__ == "__main__":
     df_info, _ = load_item_data()
 
     if USE_FINNA:
-        if not os.path.isfile(FINNA_FILE_PATH) or FORCE_FETCH:
+        if not os.path.isfile(FINNA_FILE_PATH) and os.path.isfile(FINNA_LEGACY_FILE_PATH) and not FORCE_FETCH:
+            print(f'Converting Finna data from {FINNA_LEGACY_FILE_PATH} to {FINNA_FILE_PATH}')
+            convert_finna_json(FINNA_LEGACY_FILE_PATH)
+
+        if not os.path.isfile(FINNA_FILE_PATH) or not os.path.isfile(FINNA_INDEX_FILE_PATH) or FORCE_FETCH:
             if FORCE_FETCH:
                 print('Forcing a data update from Finna')
             else:
                 print('Did not find Finna data from cache')
 
-            ids = list(set([int(x) for x in df_info['bib_id'].tolist() if x != '\\N']))
+            ids = [int(x) for x in df_info['bib_id'].dropna().unique()]
             finna_api_fetch(ids, FINNA_LIBRARY_NAME)
         else:
             print('Finna items already fetched, using these items')
 
+        finna_data = load_finna_data()
+    else:
+        finna_data = None
+
     print()
-    with Pool() as p:
-        p.map(process_phase, PREPROCESS_FILE_PATH.keys())
+    process_phases(finna_data)
@@ -1,21 +1,26 @@
-import calendar
-import copy
 import datetime
+import glob
+import hashlib
 import json
-import math
-import pickle
+import os
 import re
 import sys
-import time
 
-import requests
 import pandas as pd
 import numpy as np
 
-from multiprocessing import current_process
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from multiprocessing import Pool, current_process
 
 sys.path.append('..')
 from backend.classes.item import Item
+from finna_cache import FinnaCache, write_finna_cache
+from finna_harvester import FinnaHarvester
+from item_dataset import save_items
 from ml_conf import *
 
 
@@ -31,92 +36,37 @@ def calculate_diff_month(d1, d2):
 
 def finna_api_fetch(ids, library):
     """
-    Fetches item data from Finna API and saves it to disk
+    Fetches item data from Finna API and saves it to disk. Fetched batches are checkpointed
+    while fetching so an interrupted fetch continues from where it was left when run again.
+    Exits without saving the data if some batches could not be fetched, so that running
+    again fetches only the failed batches.
 
     :param ids: array of bib ids
     :param library: library name as identified in Finna
     """
-    unfetched = copy.deepcopy(ids)
-    results = []
-    error_urls = []
-    base_url = 'https://api.finna.fi/api/v1/record?'
-
     error_fp = f'{FINNA_FILE_PATH.split(".")[0]}_errors.json'
-    error_count = 0
 
     print('Starting fetching data from Finna API\n')
-    while len(unfetched) > 0:
-        url = base_url
-
-        # Retrieving 100 records in one request per Finna administration recommendation
-        for i in range(100):
-            url += f'id[]={library}.{str(unfetched[0])}&'
-            del unfetched[0]
-
-            if len(unfetched) == 0:
-                break
-
-        url += 'field[]=classifications&' \
-            'field[]=container&' \
-            'field[]=genres&' \
-            'field[]=id&' \
-            'field[]=newerTitles&' \
-            'field[]=previousTitles&' \
-            'field[]=nonPresenterAuthors' \
-            '&field[]=rating' \
-            '&field[]=series' \
-            '&field[]=shortTitle' \
-            '&field[]=subjectsExtended' \
-            '&field[]=publishers&' \
-            'field[]=summary&' \
-            'field[]=year&' \
-            'lng=fi'
-
-        headers = {'from': CONTACT_EMAIL}
-        res = requests.get(url, headers=headers)
-
-        if res.status_code == 200:
-            res = res.json()
-        else:
-            error_urls.append(url)
-            error_count += 1
-            continue
-
-        if res['resultCount'] == 0:
-            error_urls.append(url)
-            error_count += 1
-            continue
-
-        records = res['records']
-        results.extend(records)
-
-        print('Waiting 5 seconds to not overburden the API')
-        for i in range(5):
-            print('.', end='')
-            time.sleep(1)
-        print()
-
-        api_calls_left = math.ceil(len(unfetched) / 100)
+    harvester = FinnaHarvester(library)
+    error_urls = harvester.harvest(ids)
+    print('Data gathering from Finna API has finished!')
 
-        if api_calls_left > 0:
-            print(f'\n{api_calls_left} API calls until all data is fetched')
-            print(f'Estimating it takes another {round(api_calls_left / 12, 2)} minutes to complete')
-        else:
-            print('Data gathering from Finna API has finished!')
+    with open(error_fp, 'w') as fout:
+        json.dump({'errorUrls': error_urls}, fout)
 
-    results = {'records': results}
-    error_urls = {'errorUrls': error_urls}
-    json.dumps(results)
-    json.dumps(error_urls)
+    # Cache is written only after every batch has been fetched, otherwise the next run would
+    # use the incomplete cache instead of fetching the failed batches again
+    if len(error_urls) > 0:
+        print(f'Encountered {len(error_urls)} errors, check urls from {error_fp}')
+        print(f'Fetched batches were kept in {FINNA_CHECKPOINT_FILE_PATH}, run again to fetch the failed batches. Exiting.')
+        sys.exit(1)
 
-    with open(FINNA_FILE_PATH, 'w') as fout:
-        json.dump(results, fout)
+    n_records = write_finna_cache(harvester.records())
 
-    with open(error_fp, 'w') as fout:
-        json.dump(error_urls, fout)
+    # Checkpoint is needed only until the fetched data has been saved
+    os.remove(FINNA_CHECKPOINT_FILE_PATH)
 
-    print(f'\nFinna data was successfully saved to {FINNA_FILE_PATH}')
-    print(f'Encountered {error_count} errors, check urls from {error_fp}')
+    print(f'\n{n_records} Finna records were successfully saved to {FINNA_FILE_PATH}')
 
 
 def preprocess_basic_textual_data(data):
@@ -223,91 +173,97 @@ def preprocess_series(series):
     return [series]
 
 
-def parse_sequence(df, item_id, acquired, deleted):
+def month_number(year, month):
     """
-    Parses circulation sequence from dataframe containing circulation log.
+    Returns running number of a month, used for calculating distances between months.
 
-    :param df: dataframe containing circulation log
-    :param item_id: id of item to parse
-    :param acquired: date of acquisition of item
-    :param deleted: date of deletion of item
+    :param year: year of the month
+    :param month: month
     """
-    circ = df.loc[df['item_id'] == item_id]
-    first_circ_event = circ.datetime.min()
-    last_circ_event = circ.datetime.max()
-    data_end_last_day = calendar.monthrange(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH)[1]
-    bins = circ.groupby(pd.Grouper(key='datetime', freq='M')).count()
-    data_start_datetime = datetime.date(CIRCULATION_LOG_START_YEAR, CIRCULATION_LOG_START_MONTH, 1)
-    data_end_datetime = datetime.date(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH, data_end_last_day)
+    return year * 12 + month - 1
 
-    deleted = deleted if deleted != '' else None
 
-    # Sanity check: Drop bins earlier than data start or later than data end
-    bins = bins[(bins.index >= pd.Timestamp(CIRCULATION_LOG_START_YEAR, CIRCULATION_LOG_START_MONTH, 1)) & (
-                bins.index <= pd.Timestamp(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH, data_end_last_day))]
+def group_circulation(df_circulation):
+    """
+    Groups whole circulation log by item and month in a single pass. Returns dictionary of item ids
+    and tuples of first month and monthly circulation from that month to the last month. First and last
+    months are the months of first and last circulation event limited to the circulation log period.
 
-    # Sanity check: First circulation event is in data date range
-    if first_circ_event != None and first_circ_event < data_start_datetime:
-        first_circ_event = data_start_datetime
-    elif first_circ_event > data_end_datetime:
-        first_circ_event = data_end_datetime
+    :param df_circulation: dataframe containing circulation log
+    """
+    log_start = month_number(CIRCULATION_LOG_START_YEAR, CIRCULATION_LOG_START_MONTH)
+    log_end = month_number(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH)
 
-    # Sanity check: Last circulation event is in data date range
-    if last_circ_event != None and last_circ_event < data_start_datetime:
-        last_circ_event = data_start_datetime
-    elif last_circ_event > data_end_datetime:
-        last_circ_event = data_end_datetime
+    counts = pd.DataFrame({
+        'item_id': df_circulation['item_id'].to_numpy().astype(np.int64),
+        'month': (df_circulation['datetime'].dt.year * 12 + df_circulation['datetime'].dt.month - 1).to_numpy()
+    }).groupby(['item_id', 'month']).size()
 
-    # Case: item has been borrowed at some point in data date range
-    if not bins.empty:
-        np_sequence = bins.to_numpy(dtype=np.int64).flatten()
+    grouped = {}
 
-        # Fill months without circulation between acquisition and first issue OR data start and first issue if acquired before
-        # the circulation data starts
-        if acquired.year >= CIRCULATION_LOG_START_YEAR + 1 or (acquired.month > CIRCULATION_LOG_START_MONTH and acquired.year == CIRCULATION_LOG_START_YEAR):
-            months_to_fill_start = calculate_diff_month(first_circ_event, pd.Timestamp(acquired.year, acquired.month, acquired.day))
-        else:
-            months_to_fill_start = calculate_diff_month(first_circ_event, pd.Timestamp(CIRCULATION_LOG_START_YEAR, CIRCULATION_LOG_START_MONTH, 1))
+    if len(counts) == 0:
+        return grouped
 
-        if months_to_fill_start > 0:
-            np_sequence = np.concatenate([np.zeros(months_to_fill_start, dtype=np.int64), np_sequence])
+    item_ids = counts.index.get_level_values('item_id').to_numpy()
+    item_months = counts.index.get_level_values('month').to_numpy()
+    item_counts = counts.to_numpy()
 
-        # Calculate zeros to fill to the end of sequence
-        if deleted != None:
-            months_to_fill_end = calculate_diff_month(pd.Timestamp(deleted.year, deleted.month, deleted.day), last_circ_event)
-        else:
-            months_to_fill_end = calculate_diff_month(pd.Timestamp(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH, data_end_last_day), last_circ_event)
+    # Groupby output is sorted by item and month, so each item is one contiguous block
+    boundaries = np.flatnonzero(np.diff(item_ids)) + 1
+
+    for item_id, block_months, block_counts in zip(
+            item_ids[np.r_[0, boundaries]], np.split(item_months, boundaries), np.split(item_counts, boundaries)):
+        first = max([block_months[0], log_start])
+        last = min([block_months[-1], log_end])
+
+        # All circulation is outside of circulation log period
+        if first > last:
+            continue
+
+        in_period = (block_months >= first) & (block_months <= last)
+        bins = np.zeros(last - first + 1, dtype=np.int64)
+        bins[block_months[in_period] - first] = block_counts[in_period]
+        grouped[int(item_id)] = (int(first), bins)
+
+    return grouped
+
+
+def parse_sequence(circulation, item_id, acquired, deleted):
+    """
+    Parses circulation sequence of an item from circulation log grouped by group_circulation.
+
+    :param circulation: circulation log grouped by group_circulation
+    :param item_id: id of item to parse
+    :param acquired: date of acquisition of item
+    :param deleted: date of deletion of item
+    """
+    deleted = deleted if deleted != '' else None
+
+    # Sequence starts from acquisition OR from data start if acquired before the circulation data starts
+    if acquired.year >= CIRCULATION_LOG_START_YEAR + 1 or (acquired.month > CIRCULATION_LOG_START_MONTH and acquired.year == CIRCULATION_LOG_START_YEAR):
+        start = month_number(acquired.year, acquired.month)
+    else:
+        start = month_number(CIRCULATION_LOG_START_YEAR, CIRCULATION_LOG_START_MONTH)
 
-        if months_to_fill_end > 0:
-            np_sequence = np.append(np_sequence, np.zeros(months_to_fill_end, dtype=np.int64))
+    # Sequence ends to deletion OR to data end if item has not been deleted
+    if deleted != None:
+        end = month_number(deleted.year, deleted.month)
+    else:
+        end = month_number(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH)
+
+    # Case: item has been borrowed at some point in data date range
+    if int(item_id) in circulation:
+        first, bins = circulation[int(item_id)]
+        last = first + len(bins) - 1
+
+        # Months without circulation are filled between start and first issue and between last issue and end
+        sequence_start = min([start, first])
+        np_sequence = np.zeros(max([end, last]) - sequence_start + 1, dtype=np.int64)
+        np_sequence[first - sequence_start:last - sequence_start + 1] = bins
 
     # Case: item has not been borrowed at any point in data date range
     else:
-        # If the item was acquired after from where the circulation data starts
-        if acquired.year >= CIRCULATION_LOG_START_YEAR + 1 or (acquired.month > CIRCULATION_LOG_START_MONTH and acquired.year == CIRCULATION_LOG_START_YEAR):
-            if deleted != None:
-                empty_amount = calculate_diff_month(
-                    pd.Timestamp(deleted.year, deleted.month, deleted.day), 
-                    pd.Timestamp(acquired.year, acquired.month, acquired.day))
-                empty_amount += 1
-            else:
-                empty_amount = calculate_diff_month(
-                    pd.Timestamp(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH, 1), 
-                    pd.Timestamp(acquired.year, acquired.month, acquired.day))
-                empty_amount += 1
-        else:
-            if deleted != None:
-                empty_amount = calculate_diff_month(
-                    pd.Timestamp(deleted.year, deleted.month, deleted.day), 
-                    pd.Timestamp(CIRCULATION_LOG_START_YEAR, CIRCULATION_LOG_START_MONTH, 1))
-                empty_amount += 1
-            else:
-                empty_amount = calculate_diff_month(
-                    pd.Timestamp(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH, 1), 
-                    pd.Timestamp(CIRCULATION_LOG_START_YEAR, CIRCULATION_LOG_START_MONTH, 1))
-                empty_amount += 1
-
-        np_sequence = np.zeros(empty_amount, dtype=np.int64)
+        np_sequence = np.zeros(max([end - start + 1, 0]), dtype=np.int64)
 
     # Value -1 to the month when item was been deleted
     if deleted != None:
@@ -319,42 +275,130 @@ def parse_sequence(df, item_id, acquired, deleted):
         RuntimeError(
             'Sequence exceeds the maximum sequence length given the time period between data start and end date')
 
-    # Sanity check: Sequence of deleted items ends correctly
-    if deleted != None and np_sequence[-1] != -1:
-        RuntimeError('Sequence of deleted item does not end in -1')
-
     return np_sequence
 
 
 def load_finna_data():
     """
-    Loads data file that was retrieved from Finna API earlier.
+    Opens data file that was retrieved from Finna API earlier. Records are read from disk
+    by Finna id when they are needed instead of loading the whole file to memory.
+    """
+    return FinnaCache()
+
+
+# Columns of item information file
+ITEM_INFO_COLUMNS = ['bib_id', 'item_id', 'author', 'title'] + \
+    [x for i in range(1, 16) for x in [f'subject_{i}', f'subject_{i}_source']] + \
+    ['series', 'genre', 'isbn', 'pub_year', 'acquired', 'last_borrowed', 'issues', 'renewals', 'date_deleted']
+
+ITEM_INFO_DTYPES = {
+    'bib_id': 'Int64',
+    'item_id': 'Int64',
+    'genre': 'category',
+    'issues': 'Int64',
+    'renewals': 'Int64',
+    **{f'subject_{i}_source': 'category' for i in range(1, 16)}
+}
+
+# Columns of item information file parsed to datetimes and their formats
+ITEM_INFO_DATETIMES = {
+    'acquired': '%Y-%m-%d',
+    'last_borrowed': '%Y-%m-%d',
+    'date_deleted': '%Y-%m-%d %H:%M:%S'
+}
+
+CIRCULATION_COLUMNS = ['item_id', 'datetime', 'type']
+CIRCULATION_DTYPES = {'item_id': 'int64', 'datetime': 'str', 'type': 'category'}
+
+# Increment when parsing of input files changes so that old cache files are not used
+INPUT_CACHE_VERSION = 1
+
+
+def read_item_info(file_path):
+    """
+    Reads item information file with explicit types. Missing values (\\N) are read as NA
+    and dates that are not valid (e.g. 2013-00-01) are read as NaT.
+
+    :param file_path: path of .csv file containing item information
     """
-    with open(FINNA_FILE_PATH, 'r') as fin:
-        data = fin.read()
+    df_info = pd.read_csv(file_path, header=None, names=ITEM_INFO_COLUMNS, index_col=False,
+                          na_values=['\\N'], dtype=ITEM_INFO_DTYPES)
+
+    df_info['pub_year'] = pd.to_numeric(df_info['pub_year'], errors='coerce').astype('Int64')
+    for column, date_format in ITEM_INFO_DATETIMES.items():
+        df_info[column] = pd.to_datetime(df_info[column], format=date_format, errors='coerce')
 
-    data = json.loads(data)
-    return data['records']
+    return df_info
 
 
-def load_item_data():
+def read_circulation(file_path):
     """
-    Loads item and circulation data from preprocessed files.
+    Reads circulation log file with explicit types and parses datetimes of circulation events.
+
+    :param file_path: path of .csv file containing circulation log
     """
-    try:
-        df_info = pd.read_csv(ITEM_INFO_FILE_PATH, header=None, index_col=False, low_memory=False)
-        df_circulation = pd.read_csv(CIRCULATION_FILE_PATH, header=None, index_col=False)
+    df_circulation = pd.read_csv(file_path, header=None, names=CIRCULATION_COLUMNS, index_col=False,
+                                 dtype=CIRCULATION_DTYPES)
+
+    df_circulation['datetime'] = pd.to_datetime(df_circulation['datetime'], format='%Y-%m-%d %H:%M:%S')
+    return df_circulation
+
+
+def hash_file(file_path):
+    """
+    Calculates SHA-1 hash of file contents.
+
+    :param file_path: path of the file
+    """
+    sha = hashlib.sha1()
+
+    with open(file_path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            sha.update(block)
 
-        info_column_names = ['bib_id', 'item_id', 'author', 'title']
-        for i in range(1, 16):
-            info_column_names.append(f'subject_{i}')
-            info_column_names.append(f'subject_{i}_source')
+    return sha.hexdigest()
 
-        info_column_names.extend(['series', 'genre', 'isbn', 'pub_year',
-                                  'acquired', 'last_borrowed', 'issues', 'renewals', 'date_deleted'])
-        df_info.columns = info_column_names
 
-        df_circulation.columns = ['item_id', 'datetime', 'type']
+def read_with_cache(file_path, read):
+    """
+    Reads input file with given function and caches the result in Feather format. The cache is keyed
+    by hash of the input file, so changed input files are parsed again. Caching requires pyarrow,
+    without it the input file is always parsed.
+
+    :param file_path: path of input file
+    :param read: function parsing the input file to a dataframe
+    """
+    if pyarrow is None:
+        return read(file_path)
+
+    file_name = os.path.basename(file_path)
+    cache_path = os.path.join(INPUT_CACHE_FOLDER, f'{file_name}.{hash_file(file_path)}.v{INPUT_CACHE_VERSION}.feather')
+
+    if os.path.isfile(cache_path):
+        return pd.read_feather(cache_path)
+
+    df = read(file_path)
+
+    # Cache files of earlier versions of the same input file are not needed anymore
+    os.makedirs(INPUT_CACHE_FOLDER, exist_ok=True)
+    for old_cache_path in glob.glob(os.path.join(INPUT_CACHE_FOLDER, f'{glob.escape(file_name)}.*.feather')):
+        os.remove(old_cache_path)
+
+    df.to_feather(f'{cache_path}.tmp')
+    os.replace(f'{cache_path}.tmp', cache_path)
+    return df
+
+
+def load_item_data(info_file_path=ITEM_INFO_FILE_PATH, circulation_file_path=CIRCULATION_FILE_PATH):
+    """
+    Loads item and circulation data from preprocessed files.
+
+    :param info_file_path: path of .csv file containing item information
+    :param circulation_file_path: path of .csv file containing circulation log
+    """
+    try:
+        df_info = read_with_cache(info_file_path, read_item_info)
+        df_circulation = read_with_cache(circulation_file_path, read_circulation)
 
     except Exception as e:
         print('Problem in reading input files. Please check that item info and circulation .csv files are valid.')
@@ -364,76 +408,147 @@ def load_item_data():
     return df_info, df_circulation
 
 
-def preprocess_items(phase):
+def prepare_circulation(df_circulation):
+    """
+    Drops circulation events that are not used.
+
+    :param df_circulation: dataframe containing circulation log
+    """
+    if NO_RENEWALS:
+        df_circulation = df_circulation[df_circulation.type == 'issue']
+
+    return df_circulation.drop(columns=['type'])
+
+
+def in_phase_window(phase, acquired):
     """
-    Preprocesses items given the phase. Each phase is configured in conf.py file.
+    Checks if item acquired at given date belongs to the phase given DATA_START and DATA_END
+    configuration of the phase.
 
     :param phase: phase of processing
+    :param acquired: date of acquisition of item
     """
-    df_info, df_circulation = load_item_data()
+    after_start = acquired.year > DATA_START_YEAR[phase] or (
+        acquired.year == DATA_START_YEAR[phase] and acquired.month >= DATA_START_MONTH[phase])
+    before_end = acquired.year < DATA_END_YEAR[phase] or (
+        acquired.year == DATA_END_YEAR[phase] and acquired.month <= DATA_END_MONTH[phase])
 
-    if NO_RENEWALS:
-        df_circulation.drop(df_circulation[df_circulation.type != 'issue'].index, inplace=True)
+    return after_start and before_end
 
-    df_circulation.drop(columns=['type'], inplace=True)
-    df_circulation['datetime'] = pd.to_datetime(
-        df_circulation['datetime'], format='%Y-%m-%d %H:%M:%S')
 
+def preprocess_item(row, circulation, finna_data=None):
+    """
+    Preprocesses one row of item information and parses circulation sequence of the item.
+
+    :param row: row of item information
+    :param circulation: circulation log grouped by group_circulation
+    :param finna_data: data retrieved from Finna, required if USE_FINNA is set
+    """
     if USE_FINNA:
-        finna_data = load_finna_data()
+        item = preprocess_finna_data(row, finna_data)
+    else:
+        item = preprocess_local_data(row)
 
-    items = []
+    if item is None:
+        return None
 
-    for i in df_info.iterrows():
-        if USE_FINNA:
-            item = preprocess_finna_data(phase, i, df_circulation, finna_data)
-        else:
-            item = preprocess_local_data(phase, i, df_circulation)
+    circ_seq = parse_sequence(
+        circulation, row.item_id, item.acquired, item.deleted).tolist()
 
-        if item is None:
-            continue
+    item.set_circulation_sequence(circ_seq)
+    return item
 
-        circ_seq = parse_sequence(
-            df_circulation, i.item_id, item.acquired, item.deleted).tolist()
 
-        item.set_circulation_sequence(circ_seq)
-        items.append(item)
+# Inputs shared with preprocessing workers, set by init_preprocess_worker
+shared_circulation = None
+shared_finna_data = None
+
+
+def init_preprocess_worker(circulation, finna_data):
+    """
+    Initializer of preprocessing worker processes. Inputs shared by all chunks are handed
+    to each worker once instead of sending them with every chunk.
+
+    :param circulation: circulation log grouped by group_circulation
+    :param finna_data: data retrieved from Finna
+    """
+    global shared_circulation, shared_finna_data
+    shared_circulation = circulation
+    shared_finna_data = finna_data
+
+
+def preprocess_chunk(df_chunk):
+    """
+    Helper function for multiprocessing. Preprocesses a chunk of rows of item information
+    and returns the items that are valid.
+
+    :param df_chunk: chunk of dataframe containing item information
+    """
+    items = [preprocess_item(row, shared_circulation, shared_finna_data) for _, row in df_chunk.iterrows()]
+    return [x for x in items if x is not None]
+
+
+def preprocess_items(phases, finna_data=None):
+    """
+    Preprocesses items of given phases in a single pass. Input files are parsed once and
+    each item is added to every phase whose data window it falls in. Each phase is configured
+    in ml_conf.py file. Returns dictionary of phases and their items.
+
+    :param phases: phases of processing
+    :param finna_data: data retrieved from Finna, opened from disk if not given
+    """
+    df_info, df_circulation = load_item_data()
+    df_circulation = prepare_circulation(df_circulation)
+    circulation = group_circulation(df_circulation)
+
+    if USE_FINNA and finna_data is None:
+        finna_data = load_finna_data()
+
+    items = {x: [] for x in phases}
+    chunks = [df_info.iloc[i:i + PREPROCESS_CHUNK_SIZE] for i in range(0, len(df_info), PREPROCESS_CHUNK_SIZE)]
+
+    # Chunks are returned in order so items are always in the same order as in input file
+    with Pool(PREPROCESS_PROCESSES, initializer=init_preprocess_worker, initargs=(circulation, finna_data)) as p:
+        for chunk_items in p.imap(preprocess_chunk, chunks):
+            for item in chunk_items:
+                for phase in phases:
+                    if in_phase_window(phase, item.acquired):
+                        items[phase].append(item)
 
     return items
 
 
-def preprocess_local_data(phase, item, df_circulation):
+def preprocess_local_data(item):
     """
     Preprocesses item using data from .csv files.
 
-    :param phase: phase of preprocessing
     :param item: item to prepreprocess
-    :param df_circulation: dataframe containing circulation log
     """
-    author = preprocess_basic_textual_data(item.author) if (item.author == item.author and item.author != '\\N') else []
+    # Item id and acquisition date must be valid
+    if pd.isna(item.item_id) or pd.isna(item.acquired):
+        return None
+
+    author = preprocess_basic_textual_data(item.author) if pd.notna(item.author) else []
     title = item.title
-    series = preprocess_series(item.series) if item.series == item.series else []
-    acquired = datetime.datetime.strptime(item.acquired, '%Y-%m-%d')
-    deleted = datetime.datetime.strptime(item.date_deleted, '%Y-%m-%d %H:%M:%S') if item.date_deleted == item.date_deleted else None
+    series = preprocess_series(item.series) if pd.notna(item.series) else []
+    acquired = item.acquired.to_pydatetime()
+    deleted = item.date_deleted.to_pydatetime() if pd.notna(item.date_deleted) else None
 
-    # Thanks datapoints such as 2013-00-01
-    try:
-        last_borrowed = datetime.datetime.strptime(item.last_borrowed, '%Y-%m-%d') if item.last_borrowed == item.last_borrowed else None
-    except:
-        last_borrowed = None
+    # Dates that are not valid, such as 2013-00-01, are NaT already
+    last_borrowed = item.last_borrowed.to_pydatetime() if pd.notna(item.last_borrowed) else None
 
-    pubyear = item.pub_year if item.pub_year != '\\N' else None
+    pubyear = int(item.pub_year) if pd.notna(item.pub_year) else None
     genre = [parse_local_genre(item.genre)]
     subjects = []
 
     for i in range(15):
         subject = item.loc[f'subject_{i+1}']
-        if subject == subject and subject != '\\N':
+        if pd.notna(subject):
             subjects.append(preprocess_basic_textual_data(subject)[0])
 
     return Item(
-        bib_id=item.bib_id, 
-        item_id=item.item_id, 
+        bib_id=int(item.bib_id) if pd.notna(item.bib_id) else None, 
+        item_id=int(item.item_id), 
         authors=author, 
         title=title, 
         publishers=[], 
@@ -446,45 +561,28 @@ def preprocess_local_data(phase, item, df_circulation):
         last_borrowed=last_borrowed)
 
 
-def preprocess_finna_data(phase, item, df_circulation, finna_data):
+def preprocess_finna_data(item, finna_data):
     """
     Preprocesses item using data retrieved from Finna.
 
-    :param phase: phase of preprocessing
     :param item: item to be preprocessed
-    :param df_circulation: dataframe containing circulation log
     :param finna_data: data retrieved from finna
     """
-    bib_id = item.bib_id if item.bib_id != '\\N' else -1
-    item_id = item.item_id if item.item_id != '\\N' else -1
-
     # Bib id, item id and acquisition date must be valid
-    if bib_id == -1 or item_id == -1 or item.acquired == '\\N':
+    if pd.isna(item.bib_id) or pd.isna(item.item_id) or pd.isna(item.acquired):
         return None
 
-    acquired = datetime.datetime.strptime(item.acquired, '%Y-%m-%d')
-    deleted = datetime.datetime.strptime(item.date_deleted, '%Y-%m-%d %H:%M:%S') if item.date_deleted == item.date_deleted else None
-    
-    try:
-        last_borrowed = datetime.datetime.strptime(item.last_borrowed, '%Y-%m-%d') if item.last_borrowed == item.last_borrowed else None
-    except:
-        last_borrowed = None
-
-    finna_record = list(filter(lambda x: x["id"] == f'{FINNA_LIBRARY_NAME}.{bib_id}', finna_data))
-
-    # Drop items acquired after data end
-    if acquired.year > DATA_END_YEAR[phase] or (acquired.year == DATA_END_YEAR[phase] and acquired.month > DATA_END_MONTH[phase]):
-        return None
+    bib_id = int(item.bib_id)
+    item_id = int(item.item_id)
+    acquired = item.acquired.to_pydatetime()
+    deleted = item.date_deleted.to_pydatetime() if pd.notna(item.date_deleted) else None
+    last_borrowed = item.last_borrowed.to_pydatetime() if pd.notna(item.last_borrowed) else None
 
-    # Drop items acquired before data start
-    if acquired.year < DATA_START_YEAR[phase] or (acquired.year == DATA_START_YEAR[phase] and acquired.month < DATA_START_MONTH[phase]):
-        return None
+    finna_record = finna_data.get(f'{FINNA_LIBRARY_NAME}.{bib_id}')
 
     # Local info serves as fallback if record is not found from Finna
-    if not len(finna_record) > 0:
-        return preprocess_local_data(phase, item, df_circulation)
-
-    finna_record = finna_record[0]
+    if finna_record is None:
+        return preprocess_local_data(item)
 
     author = preprocess_basic_textual_data(
         finna_record['nonPresenterAuthors'][0]['name']) if len(finna_record['nonPresenterAuthors']) > 0 else []
@@ -515,11 +613,14 @@ def preprocess_finna_data(phase, item, df_circulation, finna_data):
         last_borrowed=last_borrowed)
 
 
-def process_phase(phase):
+def process_phases(finna_data=None):
     """
-    Helper function for multiprocessing.
+    Preprocesses items of all phases and saves them to disk.
 
-    :param phase: phase of processing
+    :param finna_data: data retrieved from Finna, opened from disk if not given
     """
-    items = preprocess_items(phase)
-    pickle.dump(items, open(PREPROCESS_FILE_PATH[phase], 'wb'))
+    items = preprocess_items(list(PREPROCESS_FILE_PATH.keys()), finna_data)
+
+    for phase, phase_items in items.items():
+        save_items(phase_items, PREPROCESS_FILE_PATH[phase])
+        print(f'Saved {len(phase_items)} items of phase {phase} to {PREPROCESS_FILE_PATH[phase]}')
@@ -0,0 +1,180 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append('..')
+
+from backend.api.api_utils import build_entity_statistics
+from backend.api.circulation import export_circulation_matrix
+from backend.classes.base import Base
+from backend.classes.db_item import DBItem
+from backend.ml.build_db import load_circulation_end, save_circulation_end, save_item
+from ml_conf import *
+from preprocess_utils import group_circulation, load_finna_data, load_item_data, month_number, \
+    prepare_circulation, preprocess_item
+
+
+def count_new_circulation(df_circulation, start, end):
+    """
+    Counts monthly circulation of items from start month to end month.
+    Returns dictionary of item ids and arrays of monthly circulation.
+
+    :param df_circulation: dataframe containing circulation log
+    :param start: running number of the first month to count
+    :param end: running number of the last month to count
+    """
+    months = df_circulation['datetime'].dt.year * 12 + df_circulation['datetime'].dt.month - 1
+    in_range = (months >= start) & (months <= end)
+
+    if (~in_range).sum() > 0:
+        print(f'Skipping {(~in_range).sum()} circulation events outside of the update period')
+
+    counts = df_circulation[in_range].groupby(
+        [df_circulation['item_id'][in_range], months[in_range] - start]).size()
+
+    result = {}
+    for (item_id, month), count in counts.items():
+        if int(item_id) not in result:
+            result[int(item_id)] = np.zeros(end - start + 1, dtype=np.int64)
+        result[int(item_id)][month] = count
+
+    return result
+
+
+def update_sequence(sequence, new_circulation, deleted_month=None):
+    """
+    Continues circulation sequence with circulation of new months. If item has been deleted
+    the sequence ends to the month of deletion the same way as in parse_sequence.
+
+    :param sequence: circulation sequence ending to the last month already in database
+    :param new_circulation: circulation of new months
+    :param deleted_month: index of deletion month counted from the first new month, None if not deleted
+    """
+    old_length = len(sequence)
+    sequence = np.concatenate([np.asarray(sequence, dtype=np.int64), new_circulation])
+
+    if deleted_month is not None:
+        sequence = sequence[:max([old_length + deleted_month + 1, 1])]
+        sequence[-1] = SEQUENCE_DELETED_SYMBOL
+
+    return sequence
+
+
+def update_database(session, df_info, df_circulation, finna_data=None):
+    """
+    Updates database with new circulation, new items and deleted items without rebuilding it.
+    Circulation sequences of items in database are continued to the month configured in
+    DATA_OBTAINED_YEAR and DATA_OBTAINED_MONTH.
+
+    :param session: database session
+    :param df_info: dataframe containing information of new and deleted items
+    :param df_circulation: dataframe containing circulation log of new months
+    :param finna_data: data retrieved from Finna, required if USE_FINNA is set
+    """
+    circulation_end = load_circulation_end(session)
+
+    if circulation_end is None:
+        raise RuntimeError('Database does not know when its circulation data ends, rebuild it with build_db.py')
+
+    start = month_number(*circulation_end) + 1
+    end = month_number(DATA_OBTAINED_YEAR, DATA_OBTAINED_MONTH)
+
+    if end < start - 1:
+        raise ValueError('Configured DATA_OBTAINED month is earlier than the last month already in database')
+
+    print(f'Updating circulation of {end - start + 1} months')
+    new_circulation = count_new_circulation(df_circulation, start, end)
+    last_borrowed = df_circulation.groupby('item_id')['datetime'].max()
+    no_circulation = np.zeros(end - start + 1, dtype=np.int64)
+
+    db_items = session.query(DBItem.id, DBItem.circulation_sequence, DBItem.deleted).all()
+    db_item_ids = set([x[0] for x in db_items])
+
+    deleted_items = {}
+    new_items = []
+
+    for _, row in df_info.iterrows():
+        if pd.isna(row.item_id):
+            continue
+
+        if int(row.item_id) in db_item_ids:
+            if pd.notna(row.date_deleted):
+                deleted_items[int(row.item_id)] = row.date_deleted.to_pydatetime()
+        else:
+            new_items.append(row)
+
+    # Items already deleted in database are left untouched
+    updates = []
+    for item_id, sequence, deleted in db_items:
+        if deleted is not None:
+            continue
+
+        update = {'id': item_id}
+        deleted_month = None
+
+        if item_id in deleted_items:
+            update['deleted'] = deleted_items[item_id]
+            deleted_month = month_number(deleted_items[item_id].year, deleted_items[item_id].month) - start
+
+        if item_id in last_borrowed.index:
+            update['last_borrowed'] = last_borrowed[item_id].date()
+
+        update['circulation_sequence'] = update_sequence(
+            sequence if sequence is not None else [], new_circulation.get(item_id, no_circulation), deleted_month)
+        updates.append(update)
+
+    session.bulk_update_mappings(DBItem, updates)
+    print(f'Updated {len(updates)} items, {len(deleted_items)} of them deleted')
+
+    circulation = group_circulation(df_circulation)
+    n_new_items = 0
+
+    for row in new_items:
+        item = preprocess_item(row, circulation, finna_data)
+
+        if item is None:
+            continue
+
+        if save_item(item, session, commit=False):
+            n_new_items += 1
+
+    print(f'Added {n_new_items} new items')
+
+    save_circulation_end(session)
+
+
+if __name__ == "__main__":
+    """
+    This script updates the recommender database incrementally with circulation log of new months
+    and new or deleted items. Set DATA_OBTAINED_YEAR and DATA_OBTAINED_MONTH to the last month of
+    the new circulation log before running. Precomputed statistics are refreshed after the update.
+    """
+    for file_path in [UPDATE_ITEM_INFO_FILE_PATH, UPDATE_CIRCULATION_FILE_PATH]:
+        if not os.path.isfile(file_path):
+            print(f'File {file_path} required for updating was not found. Exiting.')
+            sys.exit(1)
+
+    engine = create_engine(f'sqlite:///data/recommender.db', echo=False)
+    Base.metadata.create_all(engine, checkfirst=True)
+
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    df_info, df_circulation = load_item_data(UPDATE_ITEM_INFO_FILE_PATH, UPDATE_CIRCULATION_FILE_PATH)
+    df_circulation = prepare_circulation(df_circulation)
+    finna_data = load_finna_data() if USE_FINNA else None
+
+    update_database(session, df_info, df_circulation, finna_data)
+
+    print('Exporting circulation matrix')
+    export_circulation_matrix(session)
+
+    print('Refreshing entity statistics')
+    build_entity_statistics(session)
+
+    session.close()